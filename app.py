@@ -1,13 +1,81 @@
 import os
+import hashlib
 import logging
-from flask import Flask, render_template, request, redirect, url_for, flash
+from datetime import datetime
+from functools import wraps
+from flask import (Flask, current_app, flash, make_response, redirect, render_template, request, session,
+                   url_for)
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from config import config_by_name
 import models
-from utils.parser import parse_internal_links
+from utils.assets import init_assets
+from utils.cache import LRUCache
 from utils.diff import generate_html_diff
-from auth import init_auth, get_user_by_id, get_user_by_username, create_user
-from search import init_search, rebuild_index
+from utils.executor import ExecutorBusy
+from auth import init_auth, refresh_users, get_user_by_id, get_user_by_username, create_user, hash_stats
+from search import init_search, reconcile_index
+from werkzeug.http import is_resource_modified
+
+
+def _article_page(after, limit):
+    """One page of the recency listing and the cursor of the next, if any."""
+    articles = models.list_articles(limit=limit + 1, after=after)
+    if len(articles) <= limit:
+        return articles, None
+    articles = articles[:limit]
+    return articles, models.article_cursor(articles[-1])
+
+
+def _article_modified(article_id):
+    """The article's updated_at as a datetime, for Last-Modified."""
+    article = models.get_article(article_id)
+    updated = article.get('updated_at') if article else None
+    if isinstance(updated, str):
+        try:
+            updated = datetime.fromisoformat(updated)
+        except ValueError:
+            return None
+    return updated if isinstance(updated, datetime) else None
+
+
+def conditional(public=False, last_modified=None):
+    """Answer 304 Not Modified before the view runs when the client's copy is current.
+
+    The ETag combines the store generation, which every write changes, with
+    the URL and, for pages, the user. `last_modified(**view_args)` may add a
+    Last-Modified date. Public (JSON) responses may be reused by browsers
+    and proxies for API_CACHE_MAX_AGE seconds; pages are revalidated each time.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not public and session.get('_flashes'):
+                # Answering 304 would leave the pending messages unshown.
+                return view(**kwargs)
+            parts = [models.store_generation(), request.full_path]
+            if not public:
+                parts.append(current_user.get_id() or '')
+            etag = hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+            modified = last_modified(**kwargs) if last_modified else None
+            if is_resource_modified(request.environ, etag=etag, last_modified=modified):
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            if modified:
+                response.last_modified = modified
+            if public:
+                response.cache_control.public = True
+                response.cache_control.max_age = current_app.config.get('API_CACHE_MAX_AGE', 10)
+            else:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
 
 
 def create_app(config_name=None):
@@ -39,6 +107,16 @@ def create_app(config_name=None):
     login_manager.login_view = 'login'
     login_manager.login_message_category = 'warning'
 
+    # Rendered version comparisons, keyed by (v1 id, v2 id)
+    diff_cache = LRUCache(app.config.get('DIFF_CACHE_SIZE', 128))
+
+    @app.before_request
+    def refresh_stores():
+        # With the JSON backend each worker holds its own copy of the data;
+        # catch up with writes made by the other workers before reading.
+        models.refresh_store()
+        refresh_users()
+
     @login_manager.user_loader
     def load_user(user_id):
         return get_user_by_id(user_id)
@@ -52,13 +130,15 @@ def create_app(config_name=None):
 
     app.jinja_env.filters['format_date'] = format_date
 
+    # Fingerprinted, precompressed static files
+    init_assets(app)
+
     # Initialize search
     init_search(app)
     try:
-        all_articles = models.list_articles(limit=10000)
-        rebuild_index(all_articles)
+        reconcile_index(models.article_stamps, models.get_article, models.store_generation)
     except Exception as e:
-        logger.warning('Failed to rebuild search index on startup: %s', e)
+        logger.warning('Failed to reconcile search index on startup: %s', e)
 
     # ── Auth Routes ──────────────────────────────────────────────
 
@@ -82,7 +162,11 @@ def create_app(config_name=None):
                 flash('Password must be at least 6 characters', 'danger')
                 return render_template('register.html')
 
-            user = create_user(username, email, password)
+            try:
+                user = create_user(username, email, password)
+            except ExecutorBusy:
+                flash('The server is busy, please try again in a moment', 'danger')
+                return render_template('register.html'), 503
             if not user:
                 flash('Username or email already taken', 'danger')
                 return render_template('register.html')
@@ -101,7 +185,12 @@ def create_app(config_name=None):
             password = request.form.get('password', '').strip()
 
             user = get_user_by_username(username)
-            if user and user.check_password(password):
+            try:
+                valid = user is not None and user.check_password(password)
+            except ExecutorBusy:
+                flash('The server is busy, please try again in a moment', 'danger')
+                return render_template('login.html'), 503
+            if valid:
                 login_user(user)
                 flash('Logged in successfully', 'success')
                 next_page = request.args.get('next')
@@ -124,14 +213,20 @@ def create_app(config_name=None):
     def index():
         q = request.args.get('q', '')
         tag = request.args.get('tag')
-        if q:
-            articles = models.search_articles(q)
-        elif tag:
-            articles = models.list_articles_by_tag(tag)
-        else:
-            articles = models.list_articles()
-        tag_cloud = models.get_tag_cloud()
-        return render_template('index.html', articles=articles, tag_cloud=tag_cloud, q=q, selected_tag=tag)
+        after = request.args.get('after')
+        per_page = app.config['ARTICLES_PER_PAGE']
+
+        # May run on a fetch_all thread, outside the request context.
+        def listing():
+            if q:
+                return models.search_articles(q), None
+            if tag:
+                return models.list_articles_by_tag(tag), None
+            return _article_page(after, per_page)
+
+        (articles, next_cursor), tag_cloud = models.fetch_all(listing, models.get_tag_cloud)
+        return render_template('index.html', articles=articles, tag_cloud=tag_cloud, q=q, selected_tag=tag,
+                               next_cursor=next_cursor)
 
     @app.route('/articles/new', methods=['GET', 'POST'])
     @login_required
@@ -180,6 +275,7 @@ def create_app(config_name=None):
         return redirect(url_for('index'))
 
     @app.route('/articles/view')
+    @conditional()
     def view_article():
         article_id = request.args.get('article_id')
         title = request.args.get('title')
@@ -190,69 +286,116 @@ def create_app(config_name=None):
             article = models.get_article_by_title(title)
         if not article:
             return render_template('404.html'), 404
-        rendered = parse_internal_links(article['content'])
-        versions = models.get_versions(article['id'])
-        return render_template('article_view.html', article=article, rendered_content=rendered, versions=versions)
+        rendered, versions, backlinks = models.fetch_all(
+            lambda: models.render_article(article),
+            lambda: models.list_versions(article['id']),
+            lambda: models.get_backlinks(article),
+        )
+        return render_template('article_view.html', article=article, rendered_content=rendered, versions=versions,
+                               backlinks=backlinks)
 
     @app.route('/articles/<article_id>/versions')
+    @conditional(last_modified=_article_modified)
     def versions(article_id):
-        article = models.get_article(article_id)
+        article, vers = models.fetch_all(lambda: models.get_article(article_id),
+                                         lambda: models.get_versions(article_id))
         if not article:
             return render_template('404.html'), 404
-        vers = models.get_versions(article_id)
         return render_template('versions.html', article=article, versions=vers)
 
     @app.route('/articles/<article_id>/restore/<version_id>', methods=['POST'])
     @login_required
     def restore_version(article_id, version_id):
-        models.restore_version(article_id, version_id)
-        flash('Version restored', 'success')
+        try:
+            restored = models.restore_version(article_id, version_id)
+        except models.VersionChainError:
+            logger.exception('Could not restore version %s of article %s', version_id, article_id)
+            flash('That version could not be restored: its stored history is damaged', 'danger')
+            return redirect(url_for('versions', article_id=article_id))
+        if restored:
+            flash('Version restored', 'success')
+        else:
+            flash('Version not found', 'warning')
         return redirect(url_for('view_article') + f"?article_id={article_id}")
 
     @app.route('/articles/<article_id>/compare')
     def compare_versions(article_id):
-        article = models.get_article(article_id)
+        article, vers = models.fetch_all(lambda: models.get_article(article_id),
+                                         lambda: models.list_versions(article_id))
         if not article:
             return render_template('404.html'), 404
 
         v1_id = request.args.get('v1')
         v2_id = request.args.get('v2')
-        vers = models.get_versions(article_id)
-        v1 = None
-        v2 = None
-
-        if v1_id:
-            v1 = next((v for v in vers if v['id'] == v1_id), None)
-        if v2_id:
-            v2 = next((v for v in vers if v['id'] == v2_id), None)
+        v1 = next((v for v in vers if v['id'] == v1_id), None)
+        v2 = next((v for v in vers if v['id'] == v2_id), None)
 
         if not v1 or not v2:
             flash('Invalid versions selected', 'warning')
             return redirect(url_for('versions', article_id=article_id))
 
-        diff_html = generate_html_diff(v1.get('content', ''), v2.get('content', ''))
+        # Versions never change, so a diff can be reused for as long as it is kept.
+        key = (v1['id'], v2['id'])
+        diff_html = diff_cache.get(key)
+        if diff_html is None:
+            old, new = models.fetch_all(lambda: models.get_version(v1['id']), lambda: models.get_version(v2['id']))
+            diff_html = generate_html_diff(old['content'], new['content'])
+            diff_cache.put(key, diff_html)
         return render_template('compare_versions.html', article=article, v1=v1, v2=v2, diff_html=diff_html, all_versions=vers)
 
     # ── API Endpoints ────────────────────────────────────────────
 
+    @app.route('/api/articles')
+    @conditional(public=True)
+    def api_list_articles():
+        limit = request.args.get('limit', app.config['ARTICLES_PER_PAGE'], type=int)
+        limit = max(1, min(limit, app.config['ARTICLES_MAX_PAGE']))
+        articles, next_cursor = _article_page(request.args.get('after'), limit)
+        return {
+            'articles': [{
+                'id': a['id'],
+                'title': a.get('title', ''),
+                'tags': a.get('tags', []),
+                'updated_at': str(a.get('updated_at') or ''),
+            } for a in articles],
+            'next': next_cursor,
+        }
+
+    @app.route('/api/articles/<article_id>/backlinks')
+    @conditional(public=True)
+    def api_backlinks(article_id):
+        article = models.get_article(article_id)
+        if not article:
+            return {'error': 'Article not found'}, 404
+        return {'article_id': article_id, 'backlinks': models.get_backlinks(article)}
+
+    @app.route('/api/articles/orphans')
+    @conditional(public=True)
+    def api_orphans():
+        return {'orphans': models.list_orphans()}
+
+    @app.route('/api/articles/wanted')
+    @conditional(public=True)
+    def api_wanted():
+        return {'wanted': models.list_wanted()}
+
     @app.route('/api/articles/autocomplete')
+    @conditional(public=True)
     def articles_autocomplete():
-        q = request.args.get('q', '').lower()
+        q = request.args.get('q', '')
         limit = request.args.get('limit', 10, type=int)
-        all_articles = models.list_articles(limit=100)
-        matches = [a['title'] for a in all_articles if q in a['title'].lower()][:limit]
-        return {'suggestions': matches}
+        return {'suggestions': models.complete_titles(q, limit)}
 
     @app.route('/api/links/validate', methods=['POST'])
     def validate_links():
         import re
         content = request.json.get('content', '')
         links = re.findall(r'\[\[([^\[\]]+)\]\]', content)
+        found = models.get_articles_by_titles(t.strip() for t in links)
         missing = []
         valid = []
         for link_title in links:
-            article = models.get_article_by_title(link_title.strip())
-            if article:
+            if link_title.strip() in found:
                 valid.append(link_title)
             else:
                 if link_title not in missing:
@@ -265,6 +408,7 @@ def create_app(config_name=None):
         }
 
     @app.route('/api/articles/exists')
+    @conditional(public=True)
     def article_exists():
         title = request.args.get('title', '').strip()
         if not title:
@@ -273,23 +417,25 @@ def create_app(config_name=None):
         return {'exists': article is not None, 'title': title}
 
     @app.route('/api/tags/suggestions')
+    @conditional(public=True)
     def tag_suggestions():
-        q = request.args.get('q', '').strip().lower()
+        q = request.args.get('q', '')
         limit = request.args.get('limit', 10, type=int)
-        tag_cloud = models.get_tag_cloud()
-        suggestions = []
-        for tag_info in tag_cloud:
-            tag = tag_info['tag']
-            if q in tag.lower():
-                suggestions.append({
-                    'tag': tag,
-                    'count': tag_info['count'],
-                    'color': tag_info['color'],
-                })
-                if len(suggestions) >= limit:
-                    break
+        fuzzy = request.args.get('fuzzy', '0') not in ('0', '', 'false')
+        suggestions = [{'tag': tag, 'count': count, 'color': models.tag_color(tag)}
+                       for tag, count in models.suggest_tags(q, limit, fuzzy)]
         return {'suggestions': suggestions}
 
+    @app.route('/api/stats/cache')
+    @login_required
+    def cache_stats():
+        return models.cache_stats()
+
+    @app.route('/api/stats/passwords')
+    @login_required
+    def password_stats():
+        return hash_stats()
+
     # ── Error Handlers ───────────────────────────────────────────
 
     @app.errorhandler(404)
@@ -1,48 +1,132 @@
 """
 User authentication module.
-Dual backend: Firestore 'users' collection or JSON fallback in data/users.json.
+Backends: Firestore 'users' collection, SQLite 'users' table, or JSON fallback
+in data/users.json.
 """
 import uuid
+import hashlib
 import json
+import sqlite3
 import logging
 from datetime import datetime
 from pathlib import Path
 
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
 
 from firebase_module import db
+import sqlite_module
+from utils.cache import LRUCache
+from utils.executor import BoundedExecutor, ExecutorBusy, bounded_executor
+from utils.journal import Journal, replace_file
 
 logger = logging.getLogger(__name__)
 
 USE_FIRESTORE = db is not None
+USE_SQLITE = False
 
 _USERS_FILE = None
+_USERS_JOURNAL = None
 _USER_STORE = {}
+# JSON backend: username -> id and email -> id, kept in step with _USER_STORE
+_USERNAME_INDEX = {}
+_EMAIL_INDEX = {}
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+# User objects by id for Flask-Login's per-request lookup. On Firestore and
+# SQLite entries also expire, since other workers' changes go unnoticed.
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60
+_USER_CACHE = LRUCache(USER_CACHE_SIZE)
+
+# Password hashing policy, passed to werkzeug's generate_password_hash.
+# At most PASSWORD_HASH_WORKERS hashes run at once across all worker processes
+# sharing DATA_DIR, so a burst of logins can't take every CPU; past
+# PASSWORD_HASH_QUEUE waiting calls, logins are refused.
+PASSWORD_HASH_METHOD = 'scrypt'
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE = 32
+_HASHER = BoundedExecutor(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, 'password-hash')
+_HASH_PREFIX = None     # method and parameters of hashes made under the policy, set by init_auth
 
 USERS_COL = 'users'
+# Firestore: one document per taken username / email, holding {'uid'}. Their
+# ids are hashes, since document ids can't hold every character.
+USERNAMES_COL = 'usernames'
+EMAILS_COL = 'emails'
 
 
 def init_auth(app):
     """Initialize auth module with app config. Must be called after app is created."""
-    global _USERS_FILE, _USER_STORE, USE_FIRESTORE
+    global _USERS_FILE, _USERS_JOURNAL, USE_FIRESTORE, USE_SQLITE, JOURNAL_COMPACT_BYTES
+    global PASSWORD_HASH_METHOD, _HASHER, _HASH_PREFIX
 
-    if app.config.get('USE_FIRESTORE') is False:
+    backend = app.config.get('STORAGE_BACKEND')
+    if app.config.get('USE_FIRESTORE') is False or backend in ('json', 'sqlite'):
         USE_FIRESTORE = False
+    USE_SQLITE = backend == 'sqlite'
 
     data_dir = Path(app.config.get('DATA_DIR', Path(__file__).parent / 'data'))
     data_dir.mkdir(exist_ok=True)
     _USERS_FILE = data_dir / 'users.json'
+    JOURNAL_COMPACT_BYTES = app.config.get('JOURNAL_COMPACT_BYTES', JOURNAL_COMPACT_BYTES)
+    _USER_CACHE.maxsize = app.config.get('USER_CACHE_SIZE', USER_CACHE_SIZE)
+    _USER_CACHE.ttl = app.config.get('USER_CACHE_TTL', USER_CACHE_TTL) if USE_FIRESTORE or USE_SQLITE else None
+    _USER_CACHE.clear()
+    PASSWORD_HASH_METHOD = app.config.get('PASSWORD_HASH_METHOD', PASSWORD_HASH_METHOD)
+    _HASH_PREFIX = _hash_prefix(PASSWORD_HASH_METHOD)
+    _HASHER.shutdown()
+    _HASHER = bounded_executor(app.config.get('PASSWORD_HASH_WORKERS', PASSWORD_HASH_WORKERS),
+                               app.config.get('PASSWORD_HASH_QUEUE', PASSWORD_HASH_QUEUE), 'password-hash',
+                               lock_dir=data_dir / 'password-hash')
 
-    if not USE_FIRESTORE:
-        _USER_STORE.clear()
-        if _USERS_FILE.exists():
-            try:
-                _USER_STORE.update(
-                    json.loads(_USERS_FILE.read_text(encoding='utf-8'))
-                )
-            except Exception:
-                pass
+    if _USERS_JOURNAL is not None:
+        _USERS_JOURNAL.close()
+        _USERS_JOURNAL = None
+    if not USE_FIRESTORE and not USE_SQLITE:
+        # users.json is a snapshot; changes go to an append-only journal
+        # that every worker tails (see utils/journal.py).
+        _USERS_JOURNAL = Journal(data_dir / 'users-journal.log', apply=_apply_user_record,
+                                 reload=_load_users_json, fsync=app.config.get('JOURNAL_FSYNC', True))
+        with _USERS_JOURNAL.locked(shared=True):
+            pass
+
+
+def hash_password(password):
+    """Hash a password under the current policy, within the hashing cap.
+
+    Raises ExecutorBusy when too many hashes are already waiting.
+    """
+    return _HASHER.run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def _hash_prefix(method):
+    """The method and parameters werkzeug writes in front of a hash made
+    with `method`, filling in its defaults as generate_password_hash does."""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return 'scrypt:32768:8:1'
+    if name == 'pbkdf2' and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    if name in ('scrypt', 'pbkdf2'):
+        return method
+    # Anything else: let werkzeug say (or reject it) at startup.
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(pw_hash):
+    """True if `pw_hash` was made with another method or cost than the policy's."""
+    return pw_hash.split('$', 1)[0] != _HASH_PREFIX
+
+
+def hash_stats():
+    """Concurrency and queueing counters of password hashing, across processes."""
+    return {'method': PASSWORD_HASH_METHOD, **_HASHER.stats()}
+
+
+def refresh_users():
+    """Pick up users registered by other worker processes."""
+    if _USERS_JOURNAL is not None:
+        _USERS_JOURNAL.refresh()
 
 
 class User(UserMixin):
@@ -56,7 +140,20 @@ class User(UserMixin):
         self.created_at = created_at or datetime.utcnow()
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify `password`, upgrading the stored hash if the policy changed.
+
+        Raises ExecutorBusy when too many hashes are already waiting.
+        """
+        if not _HASHER.run(check_password_hash, self.password_hash, password):
+            return False
+        if needs_rehash(self.password_hash):
+            try:
+                pw_hash = hash_password(password)
+            except ExecutorBusy:
+                return True  # upgrade on a later login
+            _set_password_hash(self.id, pw_hash)
+            self.password_hash = pw_hash
+        return True
 
     def to_dict(self):
         return {
@@ -77,21 +174,74 @@ class User(UserMixin):
         )
 
 
-def _save_users_json():
-    """Persist in-memory user store to JSON file."""
-    if _USERS_FILE:
-        _USERS_FILE.write_text(
-            json.dumps(_USER_STORE, default=str, indent=2), encoding='utf-8'
-        )
+def _load_users_json():
+    """Reset the in-memory user store from the users.json snapshot."""
+    _USER_STORE.clear()
+    if _USERS_FILE.exists():
+        # Unreadable means lost users, not no users: let it raise.
+        _USER_STORE.update(json.loads(_USERS_FILE.read_text(encoding='utf-8')))
+    _USERNAME_INDEX.clear()
+    _EMAIL_INDEX.clear()
+    for uid, data in _USER_STORE.items():
+        _index_user(uid, None, data)
+    _USER_CACHE.clear()
+
+
+def _index_user(uid, old, new):
+    for index, field in ((_USERNAME_INDEX, 'username'), (_EMAIL_INDEX, 'email')):
+        if old and index.get(old.get(field)) == uid:
+            del index[old.get(field)]
+        if new:
+            index[new.get(field)] = uid
+
+
+def _apply_user_record(record):
+    old = _USER_STORE.get(record['id'])
+    if record['op'] == 'put':
+        _USER_STORE[record['id']] = record['d']
+        _index_user(record['id'], old, record['d'])
+    else:
+        _USER_STORE.pop(record['id'], None)
+        _index_user(record['id'], old, None)
+    _USER_CACHE.pop(record['id'])
+
+
+def _save_users_json(users):
+    """Durably and atomically write a users.json snapshot."""
+    replace_file(_USERS_FILE, json.dumps(users, default=str, indent=2).encode('utf-8'))
+
+
+def _commit_user(uid, data):
+    """Apply a user record in memory and append it to the journal."""
+    record = {'s': 'users', 'op': 'put', 'id': uid, 'd': data}
+    with _USERS_JOURNAL.locked():
+        _apply_user_record(record)
+        _USERS_JOURNAL.append([record])
+    if _USERS_JOURNAL.offset > JOURNAL_COMPACT_BYTES:
+        _USERS_JOURNAL.compact_in_background(lambda: dict(_USER_STORE), _save_users_json)
 
 
 def create_user(username, email, password):
-    """Register a new user. Returns User object or None if username/email taken."""
+    """Register a new user. Returns User object or None if username/email taken.
+
+    Raises ExecutorBusy when too many password hashes are already waiting.
+    """
+    if get_user_by_username(username) or get_user_by_email(email):
+        return None
+    # Hash before taking any lock: it is the slow part.
+    pw_hash = hash_password(password)
+    if not USE_FIRESTORE and not USE_SQLITE:
+        # Hold the journal lock so two workers can't register the same name.
+        with _USERS_JOURNAL.locked():
+            return _create_user(username, email, pw_hash)
+    return _create_user(username, email, pw_hash)
+
+
+def _create_user(username, email, pw_hash):
     if get_user_by_username(username) or get_user_by_email(email):
         return None
 
     uid = str(uuid.uuid4())
-    pw_hash = generate_password_hash(password)
     data = {
         'username': username,
         'email': email,
@@ -100,21 +250,97 @@ def create_user(username, email, password):
     }
 
     if USE_FIRESTORE:
-        db.collection(USERS_COL).document(uid).set(data)
+        if not _fs_create_user(uid, data):
+            return None
+    elif USE_SQLITE:
+        try:
+            with sqlite_module.transaction() as conn:
+                conn.execute(
+                    'INSERT INTO users (id, username, email, password_hash, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (uid, username, email, pw_hash, data['created_at']),
+                )
+        except sqlite3.IntegrityError:
+            # Lost a race with a concurrent registration for the same name
+            return None
     else:
-        _USER_STORE[uid] = data
-        _save_users_json()
+        _commit_user(uid, data)
 
+    _USER_CACHE.pop(uid)
     return User.from_dict(uid, data)
 
 
+def _set_password_hash(uid, pw_hash):
+    """Replace a user's stored password hash."""
+    if USE_FIRESTORE:
+        db.collection(USERS_COL).document(uid).update({'password_hash': pw_hash})
+    elif USE_SQLITE:
+        with sqlite_module.transaction() as conn:
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (pw_hash, uid))
+    else:
+        with _USERS_JOURNAL.locked():
+            data = _USER_STORE.get(uid)
+            if data:
+                _commit_user(uid, {**data, 'password_hash': pw_hash})
+    _USER_CACHE.pop(uid)
+
+
+def _key_ref(col, value):
+    return db.collection(col).document(hashlib.sha256(value.encode('utf-8')).hexdigest())
+
+
+def _fs_create_user(uid, data):
+    """Write a Firestore user with its username and email key documents.
+
+    Returns False if either key is already taken, so two registrations for
+    the same name can't both succeed.
+    """
+    from firebase_admin import firestore
+    name_ref = _key_ref(USERNAMES_COL, data['username'])
+    email_ref = _key_ref(EMAILS_COL, data['email'])
+
+    @firestore.transactional
+    def create(transaction):
+        if name_ref.get(transaction=transaction).exists or email_ref.get(transaction=transaction).exists:
+            return False
+        transaction.set(name_ref, {'uid': uid})
+        transaction.set(email_ref, {'uid': uid})
+        transaction.set(db.collection(USERS_COL).document(uid), data)
+        return True
+    return create(db.transaction())
+
+
+def _fs_user_by_key(col, field, value):
+    """Find a Firestore user through its key document."""
+    ref = _key_ref(col, value)
+    snap = ref.get()
+    if snap.exists:
+        return get_user_by_id(snap.to_dict()['uid'])
+    # Registered before key documents were kept: look it up and add one.
+    for doc in db.collection(USERS_COL).where(field, '==', value).limit(1).get():
+        ref.set({'uid': doc.id})
+        return User.from_dict(doc.id, doc.to_dict())
+    return None
+
+
 def get_user_by_id(uid):
     """Load user by ID. Used by Flask-Login's user_loader callback."""
+    user = _USER_CACHE.get(uid)
+    if user is None:
+        user = _load_user(uid)
+        if user is not None:
+            _USER_CACHE.put(uid, user)
+    return user
+
+
+def _load_user(uid):
     if USE_FIRESTORE:
         doc = db.collection(USERS_COL).document(uid).get()
         if not doc.exists:
             return None
         return User.from_dict(doc.id, doc.to_dict())
+    elif USE_SQLITE:
+        row = sqlite_module.get_db().execute('SELECT * FROM users WHERE id = ?', (uid,)).fetchone()
+        return User.from_dict(uid, dict(row)) if row else None
     else:
         data = _USER_STORE.get(uid)
         if not data:
@@ -125,26 +351,22 @@ def get_user_by_id(uid):
 def get_user_by_username(username):
     """Find user by username."""
     if USE_FIRESTORE:
-        docs = db.collection(USERS_COL).where('username', '==', username).limit(1).get()
-        for doc in docs:
-            return User.from_dict(doc.id, doc.to_dict())
-        return None
+        return _fs_user_by_key(USERNAMES_COL, 'username', username)
+    elif USE_SQLITE:
+        row = sqlite_module.get_db().execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        return User.from_dict(row['id'], dict(row)) if row else None
     else:
-        for uid, data in _USER_STORE.items():
-            if data.get('username') == username:
-                return User.from_dict(uid, data)
-        return None
+        uid = _USERNAME_INDEX.get(username)
+        return get_user_by_id(uid) if uid else None
 
 
 def get_user_by_email(email):
     """Find user by email."""
     if USE_FIRESTORE:
-        docs = db.collection(USERS_COL).where('email', '==', email).limit(1).get()
-        for doc in docs:
-            return User.from_dict(doc.id, doc.to_dict())
-        return None
+        return _fs_user_by_key(EMAILS_COL, 'email', email)
+    elif USE_SQLITE:
+        row = sqlite_module.get_db().execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+        return User.from_dict(row['id'], dict(row)) if row else None
     else:
-        for uid, data in _USER_STORE.items():
-            if data.get('email') == email:
-                return User.from_dict(uid, data)
-        return None
+        uid = _EMAIL_INDEX.get(email)
+        return get_user_by_id(uid) if uid else None
@@ -0,0 +1,52 @@
+"""
+Benchmark HTML sanitization cost by document size.
+
+Compares bleach.clean with per-call lists (how sanitize_html used to work),
+the shared Cleaner on new content, and the memo hit taken when already
+sanitized content is saved again (versions, restores).
+
+Usage:
+  python bench_sanitize.py [repeats]
+"""
+import sys
+import timeit
+
+import bleach
+
+import models
+
+PARAGRAPH = (
+    '<p>Notes on <b>[[Getting Started]]</b> with <a href="https://example.com" onclick="x()">links</a>, '
+    '<em>emphasis</em> and <code>code</code>.<script>alert(1)</script></p>\n'
+)
+
+
+def document(size):
+    return (PARAGRAPH * (size // len(PARAGRAPH) + 1))[:size]
+
+
+def bleach_per_call(content):
+    return bleach.clean(content, tags=list(models.ALLOWED_TAGS), attributes=dict(models.ALLOWED_ATTRS), strip=True)
+
+
+def fresh(content):
+    models._CLEAN_DIGESTS.clear()
+    return models.sanitize_html(content)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'size':>10} {'bleach.clean':>14} {'Cleaner':>14} {'memo hit':>14}")
+    for size in (1_000, 10_000, 100_000, 1_000_000):
+        doc = document(size)
+        clean = models.sanitize_html(doc)
+        rows = [
+            min(timeit.repeat(lambda: bleach_per_call(doc), number=1, repeat=repeats)),
+            min(timeit.repeat(lambda: fresh(doc), number=1, repeat=repeats)),
+            min(timeit.repeat(lambda: models.sanitize_html(clean), number=1, repeat=repeats)),
+        ]
+        print(f'{size:>10} ' + ' '.join(f'{t * 1000:>11.3f} ms' for t in rows))
+
+
+if __name__ == '__main__':
+    main()
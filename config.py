@@ -19,6 +19,68 @@ class Config:
     SEARCH_INDEX_DIR = str(BASE_DIR / 'data' / 'search_index')
     DATA_DIR = str(BASE_DIR / 'data')
 
+    # Search index writes are queued and committed in batches
+    SEARCH_BATCH_SIZE = 100
+    SEARCH_BATCH_DELAY = 0.5
+    SEARCH_MERGE_EVERY = 20
+
+    # Storage backend: 'firestore', 'sqlite' or 'json'. Empty picks Firestore
+    # when credentials are available and falls back to JSON files otherwise.
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', '')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', str(BASE_DIR / 'data' / 'pkb.sqlite3'))
+
+    # JSON backend: fsync each journal commit, compact past this many bytes
+    JOURNAL_FSYNC = os.environ.get('JOURNAL_FSYNC', '1') != '0'
+    JOURNAL_COMPACT_BYTES = int(os.environ.get('JOURNAL_COMPACT_BYTES', 4 * 1024 * 1024))
+
+    # Store a full version keyframe every N versions, deltas in between
+    VERSION_KEYFRAME_INTERVAL = int(os.environ.get('VERSION_KEYFRAME_INTERVAL', 20))
+
+    # Firestore/SQLite: reload the autocomplete indexes and the link graph after this many seconds
+    TITLE_INDEX_TTL = 30
+    TAG_INDEX_TTL = 30
+    LINK_GRAPH_TTL = 30
+
+    # Rendered article HTML cache: entries, and expiry on Firestore/SQLite
+    RENDER_CACHE_SIZE = 512
+    RENDER_CACHE_TTL = 60
+
+    # Article and version lookups shared between requests: entries, and expiry on Firestore
+    ARTICLE_CACHE_SIZE = 1024
+    ARTICLE_CACHE_TTL = 10
+
+    # Password hashing: werkzeug method with cost parameters, e.g. 'scrypt:32768:8:1'
+    # or 'pbkdf2:sha256:600000'. Stored hashes are upgraded on the next login.
+    # At most PASSWORD_HASH_WORKERS hashes run at once across the worker
+    # processes sharing DATA_DIR; past PASSWORD_HASH_QUEUE waiting ones,
+    # logins and registrations get a 503.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+
+    # Users kept in memory for session lookups: entries, and expiry on Firestore/SQLite
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60
+
+    # Firestore: threads a page uses to issue its independent reads at once
+    FETCH_WORKERS = 8
+
+    # Seconds browsers and proxies may reuse read-only JSON API responses
+    API_CACHE_MAX_AGE = 10
+    # Firestore: seconds a worker trusts its copy of the store generation that
+    # validates those responses and article pages
+    STORE_GENERATION_TTL = 10
+
+    # Fingerprinted and compressed copies of static/ are written here at startup
+    ASSET_BUILD_DIR = str(BASE_DIR / 'static' / 'dist')
+
+    # Version comparisons kept rendered
+    DIFF_CACHE_SIZE = 128
+
+    # Articles per dashboard page; API callers may ask for up to the max
+    ARTICLES_PER_PAGE = 100
+    ARTICLES_MAX_PAGE = 100
+
     LOG_LEVEL = logging.INFO
     DEBUG = False
     TESTING = False
@@ -43,6 +105,8 @@ class TestingConfig(Config):
     SECRET_KEY = 'test-secret-key'
     DATA_DIR = str(BASE_DIR / 'data_test')
     SEARCH_INDEX_DIR = str(BASE_DIR / 'data_test' / 'search_index')
+    SQLITE_PATH = str(BASE_DIR / 'data_test' / 'pkb.sqlite3')
+    ASSET_BUILD_DIR = str(BASE_DIR / 'data_test' / 'assets')
     USE_FIRESTORE = False
 
 
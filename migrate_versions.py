@@ -0,0 +1,23 @@
+"""
+Convert stored article versions to delta-compressed form.
+
+Versions written before delta storage keep their full content. This rewrites
+them in place as a keyframe every VERSION_KEYFRAME_INTERVAL versions and
+compressed deltas in between. Already converted versions are left alone, so
+it is safe to run more than once.
+
+Usage:
+  FLASK_CONFIG=production python migrate_versions.py
+"""
+import models
+from app import app  # noqa: F401  (initializes the configured storage backend)
+
+
+def main():
+    converted = models.compress_versions()
+    models.compact_store()
+    print(f'Compressed {converted} versions')
+
+
+if __name__ == '__main__':
+    main()
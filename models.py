@@ -3,6 +3,7 @@ Simple Firestore data access layer for Articles and Versions.
 This keeps logic separate from routes for clarity.
 """
 from firebase_module import db
+import sqlite_module
 import logging
 try:
     import bleach
@@ -10,67 +11,537 @@ except Exception:
     bleach = None
 logger = logging.getLogger(__name__)
 import json
+import os
+import hashlib
+import random
+import bisect
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 from datetime import datetime
 import uuid
+from flask import g, has_app_context
+from utils.cache import LRUCache
+from utils.completion import TagIndex, TitleIndex
+from utils.journal import Journal, replace_file
+from utils.links import LinkGraph
+from utils.parser import link_targets, normalize_title, parse_internal_links
+from utils.delta import apply_delta, decode_keyframe, encode_delta, encode_keyframe
 
 DATA_DIR = Path(__file__).parent / 'data'
 DATA_DIR.mkdir(exist_ok=True)
 ART_FILE = DATA_DIR / 'articles.json'
 VER_FILE = DATA_DIR / 'versions.json'
+JOURNAL_FILE = DATA_DIR / 'journal.log'
 
 ART_COL = 'articles'
 VER_COL = 'versions'
+TAG_COL = 'tags'  # per-tag usage counters, kept in step with article writes
+META_COL = 'meta'  # 'store-<n>' documents: shards of the generation counter
+                   # bumped by every write; also one marker per completed backfill
+# Most values a Firestore 'in' filter accepts, and most writes in a batch.
+FIRESTORE_IN_LIMIT = 30
+FIRESTORE_BATCH_LIMIT = 500
+
+# Compact the journal into the snapshot files once it grows past this size.
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+# Versions are stored as deltas against the previous version, with a full
+# keyframe every this many versions.
+VERSION_KEYFRAME_INTERVAL = 20
+# Firestore and SQLite: reload the title completion index from the database
+# this often (seconds) to pick up other workers' writes.
+TITLE_INDEX_TTL = 30
+TAG_INDEX_TTL = 30
+# Rendered article HTML kept in memory; on Firestore and SQLite entries also
+# expire, since creates by other workers can turn red links blue.
+RENDER_CACHE_SIZE = 512
+RENDER_CACHE_TTL = 60
+LINK_GRAPH_TTL = 30
+# get_article / get_versions results shared between requests. On Firestore
+# entries also expire, since other workers' writes go unnoticed.
+ARTICLE_CACHE_SIZE = 1024
+ARTICLE_CACHE_TTL = 10
+# Firestore: writes bump one of this many counter shards at random, so no
+# single document takes every write, and a worker rereads their sum at most
+# this often (seconds). Its own writes show at once.
+STORE_GENERATION_SHARDS = 16
+STORE_GENERATION_TTL = 10
+# Threads fetch_all uses to overlap independent Firestore reads.
+FETCH_WORKERS = 8
+# How many already-sanitized documents sanitize_html remembers by digest.
+SANITIZE_MEMO_SIZE = 4096
 
 USE_FIRESTORE = db is not None
+USE_SQLITE = False
 logger.info('USE_FIRESTORE=%s', USE_FIRESTORE)
 
 
 def _load_json(path):
+    """A snapshot file's content; {} if there is none yet.
+
+    An unreadable snapshot raises: the journal was truncated when it was
+    written, so starting empty would silently drop every record.
+    """
     if not path.exists():
         return {}
-    try:
-        return json.loads(path.read_text(encoding='utf-8'))
-    except Exception:
-        return {}
+    return json.loads(path.read_text(encoding='utf-8'))
 
 
 def _save_json(path, data):
-    path.write_text(json.dumps(data, default=str, indent=2), encoding='utf-8')
+    """Durably and atomically replace `path` with `data` serialized as JSON."""
+    replace_file(path, json.dumps(data, default=str, indent=2).encode('utf-8'))
 
 
 # In-memory / file fallback when Firestore isn't configured
+_ART_STORE = {}
+_VER_STORE = {}
+_STORES = {'articles': _ART_STORE, 'versions': _VER_STORE}
+_JOURNAL = None
+
+# Secondary indexes over the JSON store. Rebuilt on load and kept in sync by
+# _apply_record, so every mutation path updates them. Values are dicts used
+# as insertion-ordered sets of article ids.
+_TITLE_INDEX = {}       # exact title -> ids
+_NORM_TITLE_INDEX = {}  # normalize_title(title) -> ids
+# article id -> [(version_no, version id)] sorted ascending, so the last
+# entry carries the highest version number.
+_VERSION_INDEX = {}
+_TAG_INDEX = {}         # tag -> ids; the count is the size of the set
+_TAG_CLOUD = None       # cached get_tag_cloud() result, dropped on tag changes
+_TAG_GENERATION = 0     # bumped on every tag change, guards the cache
+# (str(updated_at), id) for every article, sorted ascending: the most
+# recently updated articles are at the end.
+_RECENT = []
+# Title completion over all articles. Kept in step by _index_article for
+# JSON, loaded lazily and refreshed on a TTL otherwise.
+_TITLES = TitleIndex()
+_TAGS = TagIndex()      # tag completion, maintained the same way
+_LINKS = LinkGraph()    # [[link]] graph: backlinks, orphans, wanted pages
+# article id -> (updated_at, rendered html, normalized link targets)
+_RENDERED = LRUCache(RENDER_CACHE_SIZE, on_evict=lambda k, v: _unlink_render(k, v))
+_LINKED_FROM = {}       # normalized link target -> ids of cached renders linking to it
+_RENDER_LOCK = threading.Lock()
+_RENDER_GENERATION = 0  # bumped on every invalidation, guards late cache fills
+# ('article' | 'versions', article id) -> get_article / get_versions result.
+# Writes drop their entries; each request also keeps its own identity map
+# on flask.g in front of this.
+_READS = LRUCache(ARTICLE_CACHE_SIZE)
+_READ_GENERATION = 0    # bumped on every invalidation, guards late cache fills
+_STORE_GENERATION = None  # Firestore: (sum of the generation shards, when read)
+_REQUEST_HITS = 0       # reads answered by a request's identity map
+_DATA_VERSION = None    # SQLite: PRAGMA data_version seen by refresh_store
+_FETCH_POOL = None      # (pid, executor) behind fetch_all
+_BACKFILLED = set()     # Firestore backfills this process knows are done
+
+
+def _index_add(index, key, doc_id):
+    index.setdefault(key, {})[doc_id] = None
+
+
+def _index_discard(index, key, doc_id):
+    ids = index.get(key)
+    if ids is not None:
+        ids.pop(doc_id, None)
+        if not ids:
+            del index[key]
+
+
+def _unlink_render(article_id, entry):
+    with _RENDER_LOCK:
+        for target in entry[2]:
+            ids = _LINKED_FROM.get(target)
+            if ids is not None:
+                ids.discard(article_id)
+                if not ids:
+                    del _LINKED_FROM[target]
+
+
+def _drop_render(article_id):
+    entry = _RENDERED.pop(article_id)
+    if entry is not None:
+        _unlink_render(article_id, entry)
+
+
+def _invalidate_renders(article_id, old, new):
+    """Drop cached HTML made stale by a write: the article's own, and that of
+    articles linking to a title which appeared or went away."""
+    global _RENDER_GENERATION
+    _RENDER_GENERATION += 1
+    if old is not None:
+        _drop_render(article_id)
+    old_title = old.get('title') if old else None
+    new_title = new.get('title') if new else None
+    if old_title == new_title:
+        return
+    for title in (old_title, new_title):
+        if title is None:
+            continue
+        with _RENDER_LOCK:
+            ids = _LINKED_FROM.pop(normalize_title(title), ())
+        for linking_id in ids:
+            _drop_render(linking_id)
+
+
+def _clear_renders():
+    global _RENDER_GENERATION
+    _RENDER_GENERATION += 1
+    _RENDERED.clear()
+    with _RENDER_LOCK:
+        _LINKED_FROM.clear()
+
+
+def _request_reads():
+    """The current request's identity map of reads, or None outside one."""
+    if not has_app_context():
+        return None
+    reads = g.get('_model_reads')
+    if reads is None:
+        reads = g._model_reads = {}
+    return reads
+
+
+def _cached_read(key, load, copy):
+    """load() through the request identity map and the shared cache.
+
+    Within a request every call returns the same object; the shared cache
+    hands out copies so callers never see each other's changes.
+    """
+    global _REQUEST_HITS
+    reads = _request_reads()
+    if reads is not None and key in reads:
+        _REQUEST_HITS += 1
+        return reads[key]
+    value = _READS.get(key)
+    if value is None:
+        generation = _READ_GENERATION
+        value = load()
+        if value is None:
+            return None
+        if generation == _READ_GENERATION:
+            _READS.put(key, value)
+    value = copy(value)
+    if reads is not None:
+        reads[key] = value
+    return value
+
+
+def _forget_reads(article_id):
+    """Drop cached reads of an article and its versions after a write."""
+    global _READ_GENERATION, _STORE_GENERATION
+    _READ_GENERATION += 1
+    _STORE_GENERATION = None
+    reads = _request_reads()
+    for key in (('article', article_id), ('versions', article_id)):
+        _READS.pop(key)
+        if reads is not None:
+            reads.pop(key, None)
+
+
+def _clear_reads():
+    global _READ_GENERATION
+    _READ_GENERATION += 1
+    _READS.clear()
+    reads = _request_reads()
+    if reads is not None:
+        reads.clear()
+
+
+def cache_stats():
+    """Sizes and hit/miss counters of the in-process caches, for tuning them."""
+    return {
+        'articles': {**_READS.stats(), 'request_hits': _REQUEST_HITS},
+        'renders': _RENDERED.stats(),
+        'sanitize': _CLEAN_DIGESTS.stats(),
+    }
+
+
+def _index_article(article_id, old, new, bulk=False):
+    """Move an article's index entries from its `old` to its `new` record."""
+    global _TAG_CLOUD, _TAG_GENERATION
+    old_title = old.get('title') if old else None
+    new_title = new.get('title') if new else None
+    if old_title != new_title:
+        if old_title is not None:
+            _index_discard(_TITLE_INDEX, old_title, article_id)
+            _index_discard(_NORM_TITLE_INDEX, normalize_title(old_title), article_id)
+        if new_title is not None:
+            _index_add(_TITLE_INDEX, new_title, article_id)
+            _index_add(_NORM_TITLE_INDEX, normalize_title(new_title), article_id)
+    old_key = (str(old.get('updated_at', '')), article_id) if old else None
+    new_key = (str(new.get('updated_at', '')), article_id) if new else None
+    if old_key != new_key:
+        if old_key is not None:
+            i = bisect.bisect_left(_RECENT, old_key)
+            if i < len(_RECENT) and _RECENT[i] == old_key:
+                del _RECENT[i]
+        if new_key is not None and bulk:
+            _RECENT.append(new_key)
+        elif new_key is not None:
+            bisect.insort(_RECENT, new_key)
+    if not bulk:
+        # _rebuild_indexes builds these from scratch after a bulk load.
+        _forget_reads(article_id)
+        if new is None:
+            _TITLES.discard(article_id)
+            _LINKS.remove(article_id)
+            _invalidate_renders(article_id, old, new)
+        else:
+            if old_title != new_title or old_key != new_key:
+                _TITLES.put(article_id, new_title, new_key[0])
+                _invalidate_renders(article_id, old, new)
+            if old is None or old_title != new_title or old.get('content') != new.get('content'):
+                _LINKS.update(article_id, new_title, link_targets(new.get('content', '')))
+    old_tags = set(old.get('tags', ())) if old else set()
+    new_tags = set(new.get('tags', ())) if new else set()
+    if old_tags != new_tags:
+        for tag in old_tags - new_tags:
+            _index_discard(_TAG_INDEX, tag, article_id)
+        for tag in new_tags - old_tags:
+            _index_add(_TAG_INDEX, tag, article_id)
+        if not bulk:
+            for tag in old_tags ^ new_tags:
+                _TAGS.set(tag, len(_TAG_INDEX.get(tag, ())))
+        _TAG_CLOUD = None
+        _TAG_GENERATION += 1
+
+
+def _index_version(version_id, old, new):
+    for record in (old, new):
+        if record:
+            _forget_reads(record['article_id'])
+    if old:
+        entries = _VERSION_INDEX.get(old['article_id'])
+        if entries is not None:
+            entries.remove((old.get('version_no', 0), version_id))
+            if not entries:
+                del _VERSION_INDEX[old['article_id']]
+    if new:
+        bisect.insort(_VERSION_INDEX.setdefault(new['article_id'], []), (new.get('version_no', 0), version_id))
+
+
+def _rebuild_indexes():
+    global _TAG_CLOUD, _TAG_GENERATION
+    _TITLE_INDEX.clear()
+    _NORM_TITLE_INDEX.clear()
+    _VERSION_INDEX.clear()
+    _TAG_INDEX.clear()
+    _TAG_CLOUD = None
+    _TAG_GENERATION += 1
+    _RECENT.clear()
+    for article_id, data in _ART_STORE.items():
+        _index_article(article_id, None, data, bulk=True)
+    _RECENT.sort()
+    _TITLES.rebuild((k, d.get('title'), str(d.get('updated_at', ''))) for k, d in _ART_STORE.items())
+    _TAGS.rebuild({tag: len(ids) for tag, ids in _TAG_INDEX.items()})
+    _LINKS.rebuild((k, d.get('title'), link_targets(d.get('content', ''))) for k, d in _ART_STORE.items())
+    _clear_renders()
+    _clear_reads()
+    for version_id, data in _VER_STORE.items():
+        _index_version(version_id, None, data)
+
+
+def _apply_record(record):
+    """Apply one journal record to the in-memory stores and their indexes."""
+    store = _STORES[record['s']]
+    old = store.get(record['id'])
+    if record['op'] == 'put':
+        new = record['d']
+        store[record['id']] = new
+    else:
+        new = None
+        store.pop(record['id'], None)
+    if record['s'] == 'articles':
+        _index_article(record['id'], old, new)
+    else:
+        _index_version(record['id'], old, new)
+
+
+def _load_snapshots():
+    """Reset the in-memory stores from the snapshot files."""
+    _ART_STORE.clear()
+    _ART_STORE.update(_load_json(ART_FILE))
+    _VER_STORE.clear()
+    _VER_STORE.update(_load_json(VER_FILE))
+    _rebuild_indexes()
+
+
+def _open_store(fsync=True):
+    """Load the JSON snapshots and replay the journal on top of them."""
+    global _JOURNAL
+    if _JOURNAL is not None:
+        _JOURNAL.close()
+    _JOURNAL = Journal(JOURNAL_FILE, apply=_apply_record, reload=_load_snapshots, fsync=fsync)
+    with _JOURNAL.locked(shared=True):
+        pass
+    logger.info('Loaded %d articles and %d versions (journal at byte %d)',
+                len(_ART_STORE), len(_VER_STORE), _JOURNAL.offset)
+
+
+def refresh_store():
+    """Pick up writes made by other worker processes. Cheap when nothing changed."""
+    global _DATA_VERSION
+    if USE_SQLITE:
+        # Any commit since the last look, ours included, may have made
+        # cached reads stale; they are cheap to refill.
+        version = sqlite_module.data_version()
+        if version != _DATA_VERSION:
+            _DATA_VERSION = version
+            _clear_reads()
+    elif not USE_FIRESTORE and _JOURNAL is not None:
+        _JOURNAL.refresh()
+
+
+def _write_lock():
+    """Serialize a read-modify-write against other threads and workers.
+
+    For the JSON backend this holds the journal lock with memory caught up
+    to every worker's writes; the databases provide their own transactions.
+    """
+    if USE_FIRESTORE or USE_SQLITE:
+        return nullcontext()
+    return _JOURNAL.locked()
+
+
+def _put(store, doc_id, data):
+    return {'s': store, 'op': 'put', 'id': doc_id, 'd': data}
+
+
+def _delete(store, doc_id):
+    return {'s': store, 'op': 'del', 'id': doc_id}
+
+
+def _commit(records):
+    """Apply mutations to the in-memory stores and durably log them."""
+    with _JOURNAL.locked():
+        for record in records:
+            _apply_record(record)
+        _JOURNAL.append(records)
+    if _JOURNAL.offset > JOURNAL_COMPACT_BYTES:
+        _JOURNAL.compact_in_background(_capture_snapshot, _write_snapshot)
+
+
+def _capture_snapshot():
+    # Records are replaced, never mutated in place, so shallow copies suffice.
+    return dict(_ART_STORE), dict(_VER_STORE)
+
+
+def _write_snapshot(state):
+    articles, versions = state
+    _save_json(ART_FILE, articles)
+    _save_json(VER_FILE, versions)
+
+
+def compact_store():
+    """Fold the journal into articles.json / versions.json synchronously."""
+    if USE_FIRESTORE or _JOURNAL is None:
+        return
+    _JOURNAL.compact(_capture_snapshot, _write_snapshot)
+
+
 if not USE_FIRESTORE:
-    _ART_STORE = _load_json(ART_FILE)
-    _VER_STORE = _load_json(VER_FILE)
-else:
-    _ART_STORE = {}
-    _VER_STORE = {}
+    _open_store()
 
 
 def init_models(app):
     """Re-initialize model stores using app config. Call after app is created."""
-    global DATA_DIR, ART_FILE, VER_FILE, _ART_STORE, _VER_STORE, USE_FIRESTORE
+    global DATA_DIR, ART_FILE, VER_FILE, JOURNAL_FILE, JOURNAL_COMPACT_BYTES, VERSION_KEYFRAME_INTERVAL
+    global TITLE_INDEX_TTL, TAG_INDEX_TTL, LINK_GRAPH_TTL, FETCH_WORKERS, _FETCH_POOL
+    global STORE_GENERATION_TTL, _STORE_GENERATION
+    global USE_FIRESTORE, USE_SQLITE
 
-    if app.config.get('USE_FIRESTORE') is False:
+    backend = app.config.get('STORAGE_BACKEND')
+    if app.config.get('USE_FIRESTORE') is False or backend in ('json', 'sqlite'):
         USE_FIRESTORE = False
+    USE_SQLITE = backend == 'sqlite'
 
     DATA_DIR = Path(app.config.get('DATA_DIR', Path(__file__).parent / 'data'))
     DATA_DIR.mkdir(exist_ok=True)
     ART_FILE = DATA_DIR / 'articles.json'
     VER_FILE = DATA_DIR / 'versions.json'
+    JOURNAL_FILE = DATA_DIR / 'journal.log'
+    JOURNAL_COMPACT_BYTES = app.config.get('JOURNAL_COMPACT_BYTES', JOURNAL_COMPACT_BYTES)
+    VERSION_KEYFRAME_INTERVAL = app.config.get('VERSION_KEYFRAME_INTERVAL', VERSION_KEYFRAME_INTERVAL)
+    TITLE_INDEX_TTL = app.config.get('TITLE_INDEX_TTL', TITLE_INDEX_TTL)
+    TAG_INDEX_TTL = app.config.get('TAG_INDEX_TTL', TAG_INDEX_TTL)
+    LINK_GRAPH_TTL = app.config.get('LINK_GRAPH_TTL', LINK_GRAPH_TTL)
+    FETCH_WORKERS = app.config.get('FETCH_WORKERS', FETCH_WORKERS)
+    STORE_GENERATION_TTL = app.config.get('STORE_GENERATION_TTL', STORE_GENERATION_TTL)
+    _STORE_GENERATION = None
+    if _FETCH_POOL is not None:
+        _FETCH_POOL[1].shutdown(wait=False)
+        _FETCH_POOL = None
+    _LINKS.built_at = None
+    _RENDERED.maxsize = app.config.get('RENDER_CACHE_SIZE', RENDER_CACHE_SIZE)
+    _RENDERED.ttl = app.config.get('RENDER_CACHE_TTL', RENDER_CACHE_TTL) if USE_FIRESTORE or USE_SQLITE else None
+    _clear_renders()
+    _READS.maxsize = app.config.get('ARTICLE_CACHE_SIZE', ARTICLE_CACHE_SIZE)
+    _READS.ttl = app.config.get('ARTICLE_CACHE_TTL', ARTICLE_CACHE_TTL) if USE_FIRESTORE else None
+    _clear_reads()
+    _TITLES.built_at = None
+    _TAGS.built_at = None
 
-    if not USE_FIRESTORE:
-        _ART_STORE.clear()
-        _ART_STORE.update(_load_json(ART_FILE))
-        _VER_STORE.clear()
-        _VER_STORE.update(_load_json(VER_FILE))
+    if USE_SQLITE:
+        sqlite_module.init_db(app.config.get('SQLITE_PATH', DATA_DIR / 'pkb.sqlite3'))
+    elif not USE_FIRESTORE:
+        _open_store(fsync=app.config.get('JOURNAL_FSYNC', True))
 
 
 def _now():
     return datetime.utcnow()
 
 
+def _parse_ts(value):
+    """Turn a timestamp stored as text back into a datetime."""
+    if not value:
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+def _article_from_row(row):
+    d = dict(row)
+    d.pop('title_norm', None)
+    d.pop('links', None)
+    d['tags'] = json.loads(d.get('tags') or '[]')
+    d['created_at'] = _parse_ts(d.get('created_at'))
+    d['updated_at'] = _parse_ts(d.get('updated_at'))
+    if d.get('updated_by') is None:
+        d.pop('updated_by', None)
+    return d
+
+
+def _version_from_row(row):
+    d = dict(row)
+    d['edited_at'] = _parse_ts(d.get('edited_at'))
+    return d
+
+
+ALLOWED_TAGS = [
+    'a', 'b', 'strong', 'i', 'em', 'u', 'p', 'br', 'ul', 'ol', 'li',
+    'h1', 'h2', 'h3', 'h4', 'pre', 'code', 'blockquote',
+]
+ALLOWED_ATTRS = {
+    'a': ['href', 'title', 'target', 'rel'],
+}
+# Digests of HTML that sanitize_html produced, so content saved earlier and
+# passed back in (versions, restores) is not parsed again.
+_CLEAN_DIGESTS = LRUCache(SANITIZE_MEMO_SIZE)
+# bleach Cleaners keep parser state and must not be shared between threads.
+_cleaners = threading.local()
+
+
+def _cleaner():
+    cleaner = getattr(_cleaners, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _cleaners.cleaner = bleach.sanitizer.Cleaner(tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
+    return cleaner
+
+
 def sanitize_html(content: str) -> str:
     """Sanitize HTML content using bleach."""
     if not content:
@@ -78,17 +549,136 @@ def sanitize_html(content: str) -> str:
     if bleach is None:
         logger.warning('bleach not installed; skipping HTML sanitization')
         return content
-    allowed_tags = [
-        'a', 'b', 'strong', 'i', 'em', 'u', 'p', 'br', 'ul', 'ol', 'li',
-        'h1', 'h2', 'h3', 'h4', 'pre', 'code', 'blockquote',
-    ]
-    allowed_attrs = {
-        'a': ['href', 'title', 'target', 'rel'],
-    }
-    cleaned = bleach.clean(content, tags=allowed_tags, attributes=allowed_attrs, strip=True)
+    if hashlib.sha256(content.encode('utf-8')).digest() in _CLEAN_DIGESTS:
+        return content
+    cleaned = _cleaner().clean(content)
+    _CLEAN_DIGESTS.put(hashlib.sha256(cleaned.encode('utf-8')).digest(), True)
     return cleaned
 
 
+def _tag_doc(tag):
+    # Tags may contain characters Firestore forbids in document ids.
+    return db.collection(TAG_COL).document(hashlib.sha1(tag.encode('utf-8')).hexdigest())
+
+
+def _count_tags(batch, old_tags, new_tags):
+    """Add Firestore tag counter updates for a change of tags to `batch`,
+    a WriteBatch or a Transaction."""
+    from firebase_admin import firestore
+    old_tags, new_tags = set(old_tags), set(new_tags)
+    for tag in new_tags - old_tags:
+        batch.set(_tag_doc(tag), {'tag': tag, 'count': firestore.Increment(1)}, merge=True)
+    for tag in old_tags - new_tags:
+        batch.set(_tag_doc(tag), {'tag': tag, 'count': firestore.Increment(-1)}, merge=True)
+
+
+def _generation_shard(n):
+    return db.collection(META_COL).document(f'store-{n}')
+
+
+def _bump_generation(batch):
+    """Add an increment of a random Firestore generation shard to `batch`,
+    a WriteBatch or a Transaction."""
+    from firebase_admin import firestore
+    shard = _generation_shard(random.randrange(STORE_GENERATION_SHARDS))
+    batch.set(shard, {'generation': firestore.Increment(1)}, merge=True)
+
+
+def store_generation():
+    """A token that changes with every write to articles, versions or tags,
+    made by any worker: the store-wide validator for HTTP caching.
+
+    On Firestore, other workers' writes show within STORE_GENERATION_TTL
+    seconds, so most requests pay no read for it; this process's own writes
+    drop the cached value (see _forget_reads) and show at once.
+    """
+    global _STORE_GENERATION
+    if USE_FIRESTORE:
+        cached = _STORE_GENERATION
+        if cached is None or time.monotonic() - cached[1] > STORE_GENERATION_TTL:
+            generation = _READ_GENERATION
+            shards = [_generation_shard(n) for n in range(STORE_GENERATION_SHARDS)]
+            total = sum((snap.to_dict() or {}).get('generation', 0) for snap in db.get_all(shards) if snap.exists)
+            cached = (total, time.monotonic())
+            if generation == _READ_GENERATION:
+                # No write of ours landed meanwhile that this read might miss.
+                _STORE_GENERATION = cached
+        return str(cached[0])
+    elif USE_SQLITE:
+        row = sqlite_module.get_db().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return str(row[0]) if row else '0'
+    else:
+        return str(_JOURNAL.generation)
+
+
+def _tag_counts():
+    """Map each tag in use to the number of articles carrying it."""
+    if USE_FIRESTORE:
+        _fs_backfill_once('tags_backfilled', _backfill_tag_counts)
+        docs = db.collection(TAG_COL).where('count', '>', 0).stream()
+        return {d.get('tag'): d.get('count') for d in docs}
+    elif USE_SQLITE:
+        rows = sqlite_module.get_db().execute(
+            'SELECT tag, COUNT(*) AS n FROM article_tags GROUP BY tag').fetchall()
+        return {r['tag']: r['n'] for r in rows}
+    else:
+        return {tag: len(ids) for tag, ids in _TAG_INDEX.items()}
+
+
+def _backfill_tag_counts():
+    """Recount Firestore tag counters from the articles, for articles written
+    before counters were kept. Counters incremented since then are
+    overwritten with the full count, and ones driven below zero by edits
+    of those articles are reset."""
+    counts = {}
+    for d in db.collection(ART_COL).select(['tags']).stream():
+        for t in set(d.to_dict().get('tags', [])):
+            counts[t] = counts.get(t, 0) + 1
+    for d in db.collection(TAG_COL).select(['tag']).stream():
+        counts.setdefault(d.get('tag'), 0)
+    batch = db.batch()
+    for i, (tag, n) in enumerate(counts.items(), 1):
+        batch.set(_tag_doc(tag), {'tag': tag, 'count': n})
+        if i % FIRESTORE_BATCH_LIMIT == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    if counts:
+        logger.info('Backfilled %d Firestore tag counters', len(counts))
+
+
+def _fetch_pool():
+    global _FETCH_POOL
+    pool = _FETCH_POOL
+    if pool is None or pool[0] != os.getpid():
+        # Threads don't survive a fork: start a new pool in the child.
+        pool = _FETCH_POOL = (os.getpid(), ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix='fetch'))
+    return pool[1]
+
+
+def fetch_all(*calls, parallel=None):
+    """Run independent reads, given as zero-argument callables, and return
+    their results in order.
+
+    With `parallel` (by default, on Firestore, where each read is a network
+    round trip) they run at the same time, so the wait is that of the
+    slowest; the local backends are faster run in turn. The calls see the
+    caller's request context, so they share its identity map.
+    """
+    if parallel is None:
+        parallel = USE_FIRESTORE
+    if (not parallel or FETCH_WORKERS < 2 or len(calls) < 2
+            or threading.current_thread().name.startswith('fetch')):
+        # Also run in turn when already on the pool: waiting on it from
+        # inside could deadlock.
+        return [call() for call in calls]
+    pool = _fetch_pool()
+    futures = [pool.submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    # The first call runs on this thread while the others are in flight.
+    first = calls[0]()
+    return [first] + [future.result() for future in futures]
+
+
 def create_article(title, content, tags, created_by='Anonymous'):
     doc_id = str(uuid.uuid4())
     safe_content = sanitize_html(content)
@@ -101,10 +691,29 @@ def create_article(title, content, tags, created_by='Anonymous'):
         'updated_at': _now(),
     }
     if USE_FIRESTORE:
-        db.collection(ART_COL).document(doc_id).set(data)
+        batch = db.batch()
+        batch.set(db.collection(ART_COL).document(doc_id),
+                  {**data, 'title_norm': normalize_title(title), 'links': link_targets(safe_content),
+                   'last_version_no': 0})
+        _count_tags(batch, [], tags)
+        _bump_generation(batch)
+        batch.commit()
+    elif USE_SQLITE:
+        with sqlite_module.transaction() as conn:
+            conn.execute(
+                'INSERT INTO articles (id, title, title_norm, content, links, tags, created_by, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (doc_id, title, normalize_title(title), safe_content, json.dumps(link_targets(safe_content)),
+                 json.dumps(tags), created_by,
+                 str(data['created_at']), str(data['updated_at'])),
+            )
+            conn.executemany('INSERT OR IGNORE INTO article_tags (article_id, tag) VALUES (?, ?)',
+                             [(doc_id, t) for t in tags])
     else:
-        _ART_STORE[doc_id] = data
-        _save_json(ART_FILE, _ART_STORE)
+        _commit([_put('articles', doc_id, data)])
+
+    if USE_FIRESTORE or USE_SQLITE:
+        _note_article(doc_id, None, data)
 
     # Update search index
     try:
@@ -117,6 +726,16 @@ def create_article(title, content, tags, created_by='Anonymous'):
 
 
 def get_article(article_id):
+    """The article with this id, or None. Served from cache when possible:
+    writes must read through _load_article instead."""
+    return _cached_read(('article', article_id), lambda: _load_article(article_id), _copy_article)
+
+
+def _copy_article(article):
+    return {**article, 'tags': list(article.get('tags') or [])}
+
+
+def _load_article(article_id):
     if USE_FIRESTORE:
         doc = db.collection(ART_COL).document(article_id).get()
         if not doc.exists:
@@ -124,6 +743,9 @@ def get_article(article_id):
         data = doc.to_dict()
         data['id'] = doc.id
         return data
+    elif USE_SQLITE:
+        row = sqlite_module.get_db().execute('SELECT * FROM articles WHERE id = ?', (article_id,)).fetchone()
+        return _article_from_row(row) if row else None
     else:
         d = _ART_STORE.get(article_id)
         if not d:
@@ -131,26 +753,133 @@ def get_article(article_id):
         return {'id': article_id, **d}
 
 
+def _fs_backfill_once(marker, run):
+    """Run the Firestore backfill `run()` unless the meta/<marker> document
+    records that it already ran; record it afterwards. Backfills must be
+    idempotent, as workers starting together may each run one."""
+    if marker in _BACKFILLED:
+        return
+    ref = db.collection(META_COL).document(marker)
+    if not ref.get().exists:
+        run()
+        ref.set({'done_at': _now()})
+    _BACKFILLED.add(marker)
+
+
+def _backfill_title_norm():
+    """Store title_norm on Firestore articles written before it was kept."""
+    batch, pending, count = db.batch(), 0, 0
+    for d in db.collection(ART_COL).select(['title', 'title_norm']).stream():
+        data = d.to_dict() or {}
+        if 'title_norm' in data:
+            continue
+        batch.update(d.reference, {'title_norm': normalize_title(data.get('title') or '')})
+        pending += 1
+        count += 1
+        if pending >= FIRESTORE_BATCH_LIMIT:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    batch.commit()
+    if count:
+        logger.info('Backfilled normalized titles on %d Firestore articles', count)
+
+
 def get_article_by_title(title):
+    """Find an article by exact title, falling back to a case- and
+    whitespace-insensitive match so [[getting started]] finds "Getting Started"."""
     if USE_FIRESTORE:
-        q = db.collection(ART_COL).where('title', '==', title).limit(1).get()
-        for doc in q:
-            d = doc.to_dict()
-            d['id'] = doc.id
-            return d
+        _fs_backfill_once('title_norm_backfilled', _backfill_title_norm)
+        for field, value in (('title', title), ('title_norm', normalize_title(title))):
+            q = db.collection(ART_COL).where(field, '==', value).limit(1).get()
+            for doc in q:
+                d = doc.to_dict()
+                d['id'] = doc.id
+                return d
         return None
+    elif USE_SQLITE:
+        row = sqlite_module.get_db().execute(
+            'SELECT * FROM articles WHERE title = ? LIMIT 1', (title,)).fetchone()
+        if row is None:
+            row = sqlite_module.get_db().execute(
+                'SELECT * FROM articles WHERE title_norm = ? LIMIT 1', (normalize_title(title),)).fetchone()
+        return _article_from_row(row) if row else None
     else:
-        for k, v in _ART_STORE.items():
-            if v.get('title') == title:
-                return {'id': k, **v}
-        return None
+        ids = _TITLE_INDEX.get(title) or _NORM_TITLE_INDEX.get(normalize_title(title))
+        if not ids:
+            return None
+        article_id = next(iter(ids))
+        return {'id': article_id, **_ART_STORE[article_id]}
+
+
+def get_articles_by_titles(titles):
+    """Resolve many titles at once, with the same matching rules as
+    get_article_by_title. Returns {title: article} for the titles found;
+    duplicates are looked up once."""
+    wanted = list(dict.fromkeys(titles))
+    found = {}
+    if USE_FIRESTORE:
+        _fs_backfill_once('title_norm_backfilled', _backfill_title_norm)
+        for field, key in (('title', lambda t: t), ('title_norm', normalize_title)):
+            keys = {}
+            for t in wanted:
+                if t not in found:
+                    keys.setdefault(key(t), []).append(t)
+            values = list(keys)
+            for i in range(0, len(values), FIRESTORE_IN_LIMIT):
+                chunk = values[i:i + FIRESTORE_IN_LIMIT]
+                for doc in db.collection(ART_COL).where(field, 'in', chunk).get():
+                    d = doc.to_dict()
+                    d['id'] = doc.id
+                    for t in keys.get(d.get(field), ()):
+                        found.setdefault(t, d)
+    elif USE_SQLITE:
+        conn = sqlite_module.get_db()
+        for field, key in (('title', lambda t: t), ('title_norm', normalize_title)):
+            keys = {}
+            for t in wanted:
+                if t not in found:
+                    keys.setdefault(key(t), []).append(t)
+            values = list(keys)
+            # Stay well under SQLite's bound-parameter limit.
+            for i in range(0, len(values), 500):
+                chunk = values[i:i + 500]
+                marks = ','.join('?' * len(chunk))
+                for row in conn.execute(f'SELECT * FROM articles WHERE {field} IN ({marks})', chunk):
+                    d = _article_from_row(row)
+                    for t in keys.get(row[field], ()):
+                        found.setdefault(t, d)
+    else:
+        for t in wanted:
+            ids = _TITLE_INDEX.get(t) or _NORM_TITLE_INDEX.get(normalize_title(t))
+            if ids:
+                article_id = next(iter(ids))
+                found[t] = {'id': article_id, **_ART_STORE[article_id]}
+    return found
+
+
+def render_article(article):
+    """The article's HTML with [[links]] resolved; links to missing pages
+    become red links. Cached per article id and updated_at."""
+    article_id = article['id']
+    stamp = str(article.get('updated_at') or '')
+    cached = _RENDERED.get(article_id)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    generation = _RENDER_GENERATION
+    content = article.get('content') or ''
+    titles = link_targets(content)
+    html = parse_internal_links(content, exists=get_articles_by_titles(titles))
+    if generation == _RENDER_GENERATION:
+        targets = frozenset(normalize_title(t) for t in titles)
+        _drop_render(article_id)
+        with _RENDER_LOCK:
+            for target in targets:
+                _LINKED_FROM.setdefault(target, set()).add(article_id)
+        _RENDERED.put(article_id, (stamp, html, targets))
+    return html
 
 
 def update_article(article_id, title, content, tags, edited_by='Anonymous'):
-    # Save current to versions
-    current = get_article(article_id)
-    if current:
-        add_version(article_id, current['content'], edited_by=edited_by)
     # Sanitize incoming HTML
     safe_content = sanitize_html(content)
     data = {
@@ -161,36 +890,91 @@ def update_article(article_id, title, content, tags, edited_by='Anonymous'):
         'updated_at': _now(),
     }
     if USE_FIRESTORE:
-        db.collection(ART_COL).document(article_id).update(data)
+        # One transaction reads the article, allocates the version number and
+        # writes the version, the article and the tag counters together.
+        def edit(transaction):
+            ref = db.collection(ART_COL).document(article_id)
+            snap = ref.get(transaction=transaction)
+            if not snap.exists:
+                return None
+            current = {'id': article_id, **snap.to_dict()}
+            meta = {'article_id': article_id, 'edited_at': data['updated_at'], 'edited_by': edited_by}
+            _, version_no = _fs_add_version(transaction, current, current.get('content', ''), meta)
+            transaction.update(ref, {**data, 'title_norm': normalize_title(title), 'links': link_targets(safe_content),
+                                     'last_version_no': version_no})
+            _count_tags(transaction, current.get('tags', []), tags)
+            _bump_generation(transaction)
+            return current
+        current = _fs_transaction(edit)
+    elif USE_SQLITE:
+        # The version and the edit commit together, or not at all if the
+        # article is gone.
+        with sqlite_module.transaction() as conn:
+            row = conn.execute('SELECT * FROM articles WHERE id = ?', (article_id,)).fetchone()
+            current = _article_from_row(row) if row else None
+            if current:
+                meta = {'article_id': article_id, 'edited_at': data['updated_at'], 'edited_by': edited_by}
+                _sqlite_add_version(conn, current['content'], meta)
+                conn.execute(
+                    'UPDATE articles SET title = ?, title_norm = ?, content = ?, links = ?, tags = ?, '
+                    'updated_by = ?, updated_at = ? WHERE id = ?',
+                    (title, normalize_title(title), safe_content, json.dumps(link_targets(safe_content)),
+                     json.dumps(tags), edited_by, str(data['updated_at']), article_id),
+                )
+                conn.execute('DELETE FROM article_tags WHERE article_id = ?', (article_id,))
+                conn.executemany('INSERT OR IGNORE INTO article_tags (article_id, tag) VALUES (?, ?)',
+                                 [(article_id, t) for t in tags])
     else:
-        if article_id in _ART_STORE:
-            _ART_STORE[article_id].update(data)
-            _save_json(ART_FILE, _ART_STORE)
+        with _write_lock():
+            # Save current to versions
+            current = _load_article(article_id)
+            if current:
+                add_version(article_id, current['content'], edited_by=edited_by)
+            if article_id in _ART_STORE:
+                _commit([_put('articles', article_id, {**_ART_STORE[article_id], **data})])
+    if current and (USE_FIRESTORE or USE_SQLITE):
+        _note_article(article_id, current, {**current, **data})
 
     # Update search index
     try:
         from search import add_to_index
-        updated = get_article(article_id)
-        if updated:
-            add_to_index(updated)
+        if current:
+            add_to_index({**current, **data, 'id': article_id})
     except Exception:
         pass
 
 
 def delete_article(article_id):
+    current = None
     if USE_FIRESTORE:
-        vers = db.collection(VER_COL).where('article_id', '==', article_id).get()
-        for v in vers:
-            db.collection(VER_COL).document(v.id).delete()
-        db.collection(ART_COL).document(article_id).delete()
+        current = _load_article(article_id)
+        # Leave room in the last batch for the article, its tag counters and
+        # the generation.
+        room = 2 + len(current.get('tags', [])) if current else 2
+        batch, pending = db.batch(), 0
+        for v in db.collection(VER_COL).where('article_id', '==', article_id).select(['version_no']).stream():
+            batch.delete(v.reference)
+            pending += 1
+            if pending >= FIRESTORE_BATCH_LIMIT - room:
+                batch.commit()
+                batch, pending = db.batch(), 0
+        batch.delete(db.collection(ART_COL).document(article_id))
+        if current:
+            _count_tags(batch, current.get('tags', []), [])
+        _bump_generation(batch)
+        batch.commit()
+    elif USE_SQLITE:
+        with sqlite_module.transaction() as conn:
+            row = conn.execute('SELECT title, tags FROM articles WHERE id = ?', (article_id,)).fetchone()
+            current = {'title': row['title'], 'tags': json.loads(row['tags'] or '[]')} if row else None
+            conn.execute('DELETE FROM versions WHERE article_id = ?', (article_id,))
+            conn.execute('DELETE FROM articles WHERE id = ?', (article_id,))
     else:
-        to_del = [k for k, v in _VER_STORE.items() if v.get('article_id') == article_id]
-        for k in to_del:
-            _VER_STORE.pop(k, None)
-        if _VER_STORE:
-            _save_json(VER_FILE, _VER_STORE)
-        _ART_STORE.pop(article_id, None)
-        _save_json(ART_FILE, _ART_STORE)
+        with _write_lock():
+            to_del = [vid for _, vid in _VERSION_INDEX.get(article_id, ())]
+            _commit([_delete('versions', k) for k in to_del] + [_delete('articles', article_id)])
+    if current and (USE_FIRESTORE or USE_SQLITE):
+        _note_article(article_id, current, None)
 
     # Remove from search index
     try:
@@ -200,23 +984,177 @@ def delete_article(article_id):
         pass
 
 
-def list_articles(limit=100):
+def _note_article(article_id, old, new):
+    """Firestore and SQLite: apply a write made by this process to the
+    in-memory indexes that _index_article maintains for JSON."""
+    if _TITLES.built_at is not None:
+        if new is None:
+            _TITLES.discard(article_id)
+        else:
+            _TITLES.put(article_id, new.get('title'), str(new.get('updated_at') or ''))
+    if _TAGS.built_at is not None:
+        _TAGS.adjust(old.get('tags', []) if old else [], new.get('tags', []) if new else [])
+    if _LINKS.built_at is not None:
+        if new is None:
+            _LINKS.remove(article_id)
+        else:
+            _LINKS.update(article_id, new.get('title'), link_targets(new.get('content', '')))
+    _invalidate_renders(article_id, old, new)
+    _forget_reads(article_id)
+
+
+def _title_index():
+    """The title completion index, reloaded from the database when stale."""
+    if not (USE_FIRESTORE or USE_SQLITE):
+        return _TITLES
+    now = time.monotonic()
+    if _TITLES.built_at is None or now - _TITLES.built_at > TITLE_INDEX_TTL:
+        if USE_FIRESTORE:
+            docs = db.collection(ART_COL).select(['title', 'updated_at']).stream()
+            items = [(d.id, (d.to_dict() or {}).get('title'), str((d.to_dict() or {}).get('updated_at') or ''))
+                     for d in docs]
+        else:
+            rows = sqlite_module.get_db().execute('SELECT id, title, updated_at FROM articles').fetchall()
+            items = [(r['id'], r['title'], str(_parse_ts(r['updated_at']) or '')) for r in rows]
+        _TITLES.rebuild(items)
+        _TITLES.built_at = now
+    return _TITLES
+
+
+def _link_graph():
+    """The link graph, reloaded from the database when stale."""
+    if not (USE_FIRESTORE or USE_SQLITE):
+        return _LINKS
+    now = time.monotonic()
+    if _LINKS.built_at is None or now - _LINKS.built_at > LINK_GRAPH_TTL:
+        if USE_FIRESTORE:
+            items, legacy = [], []
+            for d in db.collection(ART_COL).select(['title', 'links']).stream():
+                data = d.to_dict() or {}
+                if 'links' in data:
+                    items.append((d.id, data.get('title'), data['links']))
+                else:
+                    legacy.append(d.id)
+            items.extend(_backfill_links(legacy))
+        else:
+            rows = sqlite_module.get_db().execute('SELECT id, title, links FROM articles').fetchall()
+            items = [(r['id'], r['title'], json.loads(r['links'] or '[]')) for r in rows]
+        _LINKS.rebuild(items)
+        _LINKS.built_at = now
+    return _LINKS
+
+
+def _backfill_links(article_ids):
+    """Store link targets on Firestore articles written before they were kept."""
+    items = []
+    batch = db.batch()
+    for i, article_id in enumerate(article_ids, 1):
+        article = get_article(article_id)
+        if article is None:
+            continue
+        links = link_targets(article.get('content', ''))
+        batch.update(db.collection(ART_COL).document(article_id), {'links': links})
+        items.append((article_id, article.get('title'), links))
+        if i % FIRESTORE_BATCH_LIMIT == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    if items:
+        logger.info('Backfilled link targets on %d Firestore articles', len(items))
+    return items
+
+
+def get_backlinks(article):
+    """Articles linking to `article`, as [{'id', 'title'}] sorted by title."""
+    found = _link_graph().backlinks(article.get('title'))
+    return [{'id': i, 'title': t} for i, t in sorted(found, key=lambda x: (x[1] or '').casefold())
+            if i != article.get('id')]
+
+
+def list_orphans():
+    """Articles no other article links to, as [{'id', 'title'}]."""
+    found = _link_graph().orphans()
+    return [{'id': i, 'title': t} for i, t in sorted(found, key=lambda x: (x[1] or '').casefold())]
+
+
+def list_wanted():
+    """Link targets with no article yet, most linked first, as [{'title', 'count'}]."""
+    found = _link_graph().wanted()
+    return [{'title': t, 'count': n} for t, n in sorted(found, key=lambda x: (-x[1], x[0].casefold()))]
+
+
+def complete_titles(query, limit=10):
+    """Titles for wiki-link autocomplete: prefix matches first, then
+    substring matches, most recently updated first within each."""
+    return _title_index().complete(query, limit)
+
+
+def article_cursor(article):
+    """Opaque keyset cursor for `article`: resume a listing right after it."""
+    return f"{article.get('updated_at') or ''},{article['id']}"
+
+
+def _parse_cursor(cursor):
+    stamp, sep, article_id = (cursor or '').rpartition(',')
+    if not sep or not article_id:
+        return None
+    return stamp, article_id
+
+
+def list_articles(limit=100, after=None):
+    """Most recently updated articles first.
+
+    `after` is a cursor from `article_cursor()`; the page then starts with
+    the article that follows it, so deep pages cost no more than the first.
+    """
+    key = _parse_cursor(after)
     if USE_FIRESTORE:
-        docs = db.collection(ART_COL).order_by('updated_at', direction='DESCENDING').limit(limit).stream()
+        query = (db.collection(ART_COL).order_by('updated_at', direction='DESCENDING')
+                 .order_by('__name__', direction='DESCENDING'))
+        if key:
+            # Resume from the position in the cursor, not the article's
+            # current one: it may have been edited or deleted since.
+            stamp = _parse_ts(key[0])
+            if not isinstance(stamp, datetime):
+                return []  # not a cursor this listing produced
+            query = query.start_after({'updated_at': stamp, '__name__': db.collection(ART_COL).document(key[1])})
+        docs = query.limit(limit).stream()
         out = []
         for d in docs:
             item = d.to_dict()
             item['id'] = d.id
             out.append(item)
         return out
+    elif USE_SQLITE:
+        if key:
+            rows = sqlite_module.get_db().execute(
+                'SELECT * FROM articles WHERE (updated_at, id) < (?, ?) '
+                'ORDER BY updated_at DESC, id DESC LIMIT ?', (key[0], key[1], limit)).fetchall()
+        else:
+            rows = sqlite_module.get_db().execute(
+                'SELECT * FROM articles ORDER BY updated_at DESC, id DESC LIMIT ?', (limit,)).fetchall()
+        return [_article_from_row(r) for r in rows]
     else:
+        end = bisect.bisect_left(_RECENT, key) if key else len(_RECENT)
         items = []
-        for k, v in _ART_STORE.items():
-            itm = dict(v)
+        for _, k in reversed(_RECENT[max(0, end - limit):end]):
+            itm = dict(_ART_STORE[k])
             itm['id'] = k
             items.append(itm)
-        items.sort(key=lambda x: str(x.get('updated_at', '')), reverse=True)
-        return items[:limit]
+        return items
+
+
+def article_stamps():
+    """Map every article id to its search.document_stamp, without loading content."""
+    from search import normalize_stamp
+    if USE_FIRESTORE:
+        docs = db.collection(ART_COL).select(['updated_at']).stream()
+        return {d.id: normalize_stamp(d.to_dict().get('updated_at')) for d in docs}
+    elif USE_SQLITE:
+        rows = sqlite_module.get_db().execute('SELECT id, updated_at FROM articles').fetchall()
+        return {r['id']: normalize_stamp(r['updated_at']) for r in rows}
+    else:
+        return {k: normalize_stamp(v.get('updated_at')) for k, v in _ART_STORE.items()}
 
 
 def list_articles_by_tag(tag):
@@ -228,14 +1166,13 @@ def list_articles_by_tag(tag):
             item['id'] = d.id
             out.append(item)
         return out
+    elif USE_SQLITE:
+        rows = sqlite_module.get_db().execute(
+            'SELECT a.* FROM article_tags t JOIN articles a ON a.id = t.article_id WHERE t.tag = ?',
+            (tag,)).fetchall()
+        return [_article_from_row(r) for r in rows]
     else:
-        out = []
-        for k, v in _ART_STORE.items():
-            if tag in v.get('tags', []):
-                item = dict(v)
-                item['id'] = k
-                out.append(item)
-        return out
+        return [{'id': k, **_ART_STORE[k]} for k in _TAG_INDEX.get(tag, ())]
 
 
 def search_articles(q):
@@ -261,136 +1198,390 @@ def search_articles(q):
     return results
 
 
+def _version_chain(article_id, first_no, last_no):
+    """Stored version records of an article with first_no <= version_no <= last_no, oldest first."""
+    if USE_FIRESTORE:
+        docs = (db.collection(VER_COL).where('article_id', '==', article_id)
+                .where('version_no', '>=', first_no).where('version_no', '<=', last_no)
+                .order_by('version_no').stream())
+        return [{'id': d.id, **d.to_dict()} for d in docs]
+    elif USE_SQLITE:
+        rows = sqlite_module.get_db().execute(
+            'SELECT * FROM versions WHERE article_id = ? AND version_no BETWEEN ? AND ? ORDER BY version_no',
+            (article_id, first_no, last_no)).fetchall()
+        return [_version_from_row(r) for r in rows]
+    else:
+        entries = _VERSION_INDEX.get(article_id, [])
+        lo = bisect.bisect_left(entries, (first_no,))
+        hi = bisect.bisect_left(entries, (last_no + 1,))
+        return [{'id': vid, **_VER_STORE[vid]} for _, vid in entries[lo:hi]]
+
+
+def _stored_version(version_id):
+    if USE_FIRESTORE:
+        doc = db.collection(VER_COL).document(version_id).get()
+        return {'id': doc.id, **doc.to_dict()} if doc.exists else None
+    elif USE_SQLITE:
+        row = sqlite_module.get_db().execute('SELECT * FROM versions WHERE id = ?', (version_id,)).fetchone()
+        return _version_from_row(row) if row else None
+    else:
+        v = _VER_STORE.get(version_id)
+        return {'id': version_id, **v} if v else None
+
+
+def _chain_base(record):
+    """Version number of the keyframe a stored record is reconstructed from."""
+    if record.get('encoding') == 'delta':
+        return record['base_no']
+    return record.get('version_no', 0)
+
+
+class VersionChainError(Exception):
+    """A stored version can't be decoded: its delta chain has a gap."""
+
+
+def _materialize_versions(records):
+    """Decode stored version records (oldest first) into dicts with `content`.
+
+    Deltas are applied to the content of the record just before them, so
+    `records` must start at a keyframe and have no gaps; VersionChainError
+    is raised otherwise, rather than making up content.
+    """
+    out = []
+    prev = None
+    for record in records:
+        item = dict(record)
+        encoding = item.pop('encoding', '') or ''
+        payload = item.pop('payload', None)
+        item.pop('base_no', None)
+        if encoding == 'zlib':
+            item['content'] = decode_keyframe(payload)
+        elif encoding == 'delta':
+            if prev is None or prev['version_no'] != item['version_no'] - 1:
+                raise VersionChainError(f"Broken delta chain at version {item.get('id')} "
+                                        f"of article {item.get('article_id')}")
+            item['content'] = apply_delta(prev['content'], payload)
+        else:
+            item['content'] = item.get('content') or ''
+        out.append(item)
+        prev = item
+    return out
+
+
+def _version_content(record):
+    """Reconstruct the full content of one stored version record."""
+    if record.get('encoding') != 'delta':
+        return _materialize_versions([record])[0]['content']
+    chain = _version_chain(record['article_id'], record['base_no'], record['version_no'])
+    if not chain or chain[-1]['id'] != record['id']:
+        raise VersionChainError(f"Broken delta chain at version {record['id']} of article {record['article_id']}")
+    return _materialize_versions(chain)[-1]['content']
+
+
+def _encode_version(version_no, content, prev, prev_content=None):
+    """Storage fields for a new version following the stored record `prev`.
+
+    Starts a new keyframe every VERSION_KEYFRAME_INTERVAL versions and stores
+    a compressed delta against the previous version otherwise.
+    """
+    if prev is None or version_no - _chain_base(prev) >= VERSION_KEYFRAME_INTERVAL:
+        return {'encoding': 'zlib', 'base_no': version_no, 'payload': encode_keyframe(content), 'size': len(content)}
+    if prev_content is None:
+        prev_content = _version_content(prev)
+    return {'encoding': 'delta', 'base_no': _chain_base(prev), 'payload': encode_delta(prev_content, content),
+            'size': len(content)}
+
+
 def add_version(article_id, content, edited_by='System'):
     safe_content = sanitize_html(content)
+    vid = str(uuid.uuid4())
+    meta = {
+        'article_id': article_id,
+        'edited_at': _now(),
+        'edited_by': edited_by,
+    }
     if USE_FIRESTORE:
-        vs = db.collection(VER_COL).where('article_id', '==', article_id).order_by('version_no', direction='DESCENDING').limit(1).get()
-        if vs:
-            last = vs[0].to_dict()
-            next_no = last.get('version_no', 0) + 1
-        else:
-            next_no = 1
-        vid = str(uuid.uuid4())
-        data = {
-            'article_id': article_id,
-            'version_no': next_no,
-            'content': safe_content,
-            'edited_at': _now(),
-            'edited_by': edited_by,
-        }
-        db.collection(VER_COL).document(vid).set(data)
-        return {'id': vid, **data}
+        def add(transaction):
+            ref = db.collection(ART_COL).document(article_id)
+            snap = ref.get(transaction=transaction)
+            article = {'id': article_id, **(snap.to_dict() if snap.exists else {})}
+            version_id, version_no = _fs_add_version(transaction, article, safe_content, meta)
+            if snap.exists:
+                transaction.update(ref, {'last_version_no': version_no})
+            _bump_generation(transaction)
+            return version_id, version_no
+        vid, next_no = _fs_transaction(add)
+    elif USE_SQLITE:
+        with sqlite_module.transaction() as conn:
+            vid, next_no = _sqlite_add_version(conn, safe_content, meta)
     else:
-        last_no = 0
-        for v in _VER_STORE.values():
-            if v.get('article_id') == article_id:
-                last_no = max(last_no, v.get('version_no', 0))
-        next_no = last_no + 1
-        vid = str(uuid.uuid4())
-        data = {
-            'article_id': article_id,
-            'version_no': next_no,
-            'content': safe_content,
-            'edited_at': _now(),
-            'edited_by': edited_by,
-        }
-        _VER_STORE[vid] = data
-        _save_json(VER_FILE, _VER_STORE)
-        return {'id': vid, **data}
+        with _write_lock():
+            entries = _VERSION_INDEX.get(article_id)
+            last = {'id': entries[-1][1], **_VER_STORE[entries[-1][1]]} if entries else None
+            next_no = last['version_no'] + 1 if last else 1
+            data = {**meta, 'version_no': next_no, **_encode_version(next_no, safe_content, last)}
+            _commit([_put('versions', vid, data)])
+    _forget_reads(article_id)
+    return {'id': vid, **meta, 'version_no': next_no, 'size': len(safe_content), 'content': safe_content}
+
+
+def _sqlite_add_version(conn, content, meta):
+    """Insert a version holding `content` within the caller's SQLite
+    transaction. Returns (version id, version_no)."""
+    row = conn.execute(
+        'SELECT * FROM versions WHERE article_id = ? ORDER BY version_no DESC LIMIT 1',
+        (meta['article_id'],)).fetchone()
+    last = _version_from_row(row) if row else None
+    next_no = last['version_no'] + 1 if last else 1
+    vid = str(uuid.uuid4())
+    data = {**meta, 'version_no': next_no, **_encode_version(next_no, content, last)}
+    conn.execute(
+        'INSERT INTO versions (id, article_id, version_no, encoding, base_no, payload, size, edited_at, edited_by) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (vid, meta['article_id'], next_no, data['encoding'], data['base_no'], data['payload'], data['size'],
+         str(data['edited_at']), meta['edited_by']),
+    )
+    return vid, next_no
+
+
+def _fs_transaction(fn):
+    """Run fn(transaction) in a Firestore transaction, retried on contention."""
+    from firebase_admin import firestore
+    return firestore.transactional(fn)(db.transaction())
+
+
+def _fs_add_version(transaction, article, content, meta):
+    """Queue a new version of `article`, as read in `transaction`, holding
+    `content`. Returns (version id, version_no).
+
+    The caller must store version_no in the article's last_version_no in the
+    same transaction: concurrent editors then conflict on the article
+    document instead of both taking the same number.
+    """
+    last_no = article.get('last_version_no')
+    versions = db.collection(VER_COL).where('article_id', '==', article['id'])
+    if last_no is None:
+        # Written before the counter was kept.
+        docs = list(transaction.get(versions.order_by('version_no', direction='DESCENDING').limit(1)))
+    elif last_no:
+        docs = list(transaction.get(versions.where('version_no', '==', last_no).limit(1)))
+    else:
+        docs = []
+    last = {'id': docs[0].id, **docs[0].to_dict()} if docs else None
+    next_no = (last['version_no'] if last else last_no or 0) + 1
+    vid = str(uuid.uuid4())
+    data = {**meta, 'version_no': next_no, **_encode_version(next_no, content, last)}
+    transaction.set(db.collection(VER_COL).document(vid), data)
+    return vid, next_no
 
 
 def get_versions(article_id):
+    """All versions of an article with their content, newest first."""
+    return _cached_read(('versions', article_id), lambda: _load_versions(article_id),
+                        lambda versions: [dict(v) for v in versions])
+
+
+def _load_versions(article_id):
     if USE_FIRESTORE:
-        docs = db.collection(VER_COL).where('article_id', '==', article_id).order_by('version_no', direction='DESCENDING').stream()
-        out = []
-        for d in docs:
-            item = d.to_dict()
-            item['id'] = d.id
-            out.append(item)
-        return out
+        docs = db.collection(VER_COL).where('article_id', '==', article_id).order_by('version_no').stream()
+        stored = [{'id': d.id, **d.to_dict()} for d in docs]
+    elif USE_SQLITE:
+        rows = sqlite_module.get_db().execute(
+            'SELECT * FROM versions WHERE article_id = ? ORDER BY version_no', (article_id,)).fetchall()
+        stored = [_version_from_row(r) for r in rows]
     else:
-        out = []
-        for k, v in _VER_STORE.items():
-            if v.get('article_id') == article_id:
-                itm = dict(v)
-                itm['id'] = k
-                out.append(itm)
-        out.sort(key=lambda x: x.get('version_no', 0), reverse=True)
-        return out
+        stored = [{'id': vid, **_VER_STORE[vid]} for _, vid in _VERSION_INDEX.get(article_id, ())]
+    return _materialize_versions(stored)[::-1]
 
 
-def restore_version(article_id, version_id):
+VERSION_FIELDS = ['article_id', 'version_no', 'edited_at', 'edited_by', 'size']
+
+
+def _version_meta(record):
+    meta = {'id': record['id'], **{k: record.get(k) for k in VERSION_FIELDS}}
+    if meta['size'] is None and not record.get('encoding') and 'content' in record:
+        # Stored before sizes were recorded, with plain content.
+        meta['size'] = len(record['content'] or '')
+    return meta
+
+
+def list_versions(article_id):
+    """Version metadata of an article (id, version_no, edited_at, edited_by,
+    size in characters), newest first, without decoding any content."""
     if USE_FIRESTORE:
-        vdoc = db.collection(VER_COL).document(version_id).get()
-        if not vdoc.exists:
-            return False
-        v = vdoc.to_dict()
-        current = get_article(article_id)
-        if current:
-            add_version(article_id, current['content'])
-        db.collection(ART_COL).document(article_id).update({'content': v['content'], 'updated_at': _now()})
-        return True
+        docs = (db.collection(VER_COL).where('article_id', '==', article_id)
+                .select(VERSION_FIELDS).order_by('version_no', direction='DESCENDING').stream())
+        return [_version_meta({'id': d.id, **d.to_dict()}) for d in docs]
+    elif USE_SQLITE:
+        rows = sqlite_module.get_db().execute(
+            'SELECT id, article_id, version_no, edited_at, edited_by, encoding, '
+            "CASE WHEN size IS NULL AND encoding = '' THEN length(content) ELSE size END AS size "
+            'FROM versions WHERE article_id = ? ORDER BY version_no DESC', (article_id,)).fetchall()
+        return [_version_meta(_version_from_row(r)) for r in rows]
     else:
-        v = _VER_STORE.get(version_id)
+        return [_version_meta({'id': vid, **_VER_STORE[vid]}) for _, vid in reversed(_VERSION_INDEX.get(article_id, ()))]
+
+
+def get_version(version_id):
+    """One version with its content, or None. Decodes only its own delta chain."""
+    record = _stored_version(version_id)
+    if record is None:
+        return None
+    return {**_version_meta(record), 'content': _version_content(record)}
+
+
+def restore_version(article_id, version_id):
+    with _write_lock():
+        v = _stored_version(version_id)
         if not v:
             return False
-        current = get_article(article_id)
-        if current:
-            add_version(article_id, current['content'])
-        if article_id in _ART_STORE:
-            _ART_STORE[article_id]['content'] = v['content']
-            _ART_STORE[article_id]['updated_at'] = _now()
-            _save_json(ART_FILE, _ART_STORE)
+        content = _version_content(v)
+        if USE_FIRESTORE:
+            restored = {'content': content, 'updated_at': _now()}
+
+            def restore(transaction):
+                ref = db.collection(ART_COL).document(article_id)
+                snap = ref.get(transaction=transaction)
+                if not snap.exists:
+                    return None
+                current = {'id': article_id, **snap.to_dict()}
+                meta = {'article_id': article_id, 'edited_at': restored['updated_at'], 'edited_by': 'System'}
+                _, version_no = _fs_add_version(transaction, current, current.get('content', ''), meta)
+                transaction.update(ref, {**restored, 'links': link_targets(content), 'last_version_no': version_no})
+                _bump_generation(transaction)
+                return current
+            current = _fs_transaction(restore)
+            if not current:
+                return False
+            _note_article(article_id, current, {**current, **restored})
             return True
-        return False
+        elif USE_SQLITE:
+            restored = {'content': content, 'updated_at': _now()}
+            with sqlite_module.transaction() as conn:
+                row = conn.execute('SELECT * FROM articles WHERE id = ?', (article_id,)).fetchone()
+                if not row:
+                    return False
+                current = _article_from_row(row)
+                meta = {'article_id': article_id, 'edited_at': restored['updated_at'], 'edited_by': 'System'}
+                _sqlite_add_version(conn, current['content'], meta)
+                conn.execute(
+                    'UPDATE articles SET content = ?, links = ?, updated_at = ? WHERE id = ?',
+                    (content, json.dumps(link_targets(content)), str(restored['updated_at']), article_id))
+            _note_article(article_id, current, {**current, **restored})
+            return True
+        else:
+            current = _load_article(article_id)
+            if current:
+                add_version(article_id, current['content'])
+            if article_id in _ART_STORE:
+                restored = {**_ART_STORE[article_id], 'content': content, 'updated_at': _now()}
+                _commit([_put('articles', article_id, restored)])
+                return True
+            return False
+
+
+def compress_versions():
+    """Convert versions stored with full content to keyframes and deltas in place.
+
+    Returns the number of version records rewritten.
+    """
+    with _write_lock():
+        if USE_FIRESTORE:
+            by_article = {}
+            for d in db.collection(VER_COL).stream():
+                item = {'id': d.id, **d.to_dict()}
+                by_article.setdefault(item['article_id'], []).append(item)
+        elif USE_SQLITE:
+            by_article = {}
+            for r in sqlite_module.get_db().execute('SELECT * FROM versions'):
+                item = _version_from_row(r)
+                by_article.setdefault(item['article_id'], []).append(item)
+        else:
+            by_article = {aid: [{'id': vid, **_VER_STORE[vid]} for _, vid in entries]
+                          for aid, entries in _VERSION_INDEX.items()}
+
+        converted = 0
+        for article_id, stored in by_article.items():
+            stored.sort(key=lambda v: v['version_no'])
+            contents = [v['content'] for v in _materialize_versions(stored)]
+            rewritten = []
+            for i, record in enumerate(stored):
+                if record.get('encoding'):
+                    continue
+                prev = stored[i - 1] if i else None
+                fields = _encode_version(record['version_no'], contents[i], prev, contents[i - 1] if i else None)
+                record.pop('content', None)
+                record.update(fields)
+                rewritten.append(record)
+            if not rewritten:
+                continue
+            if USE_FIRESTORE:
+                for start in range(0, len(rewritten), FIRESTORE_BATCH_LIMIT):
+                    batch = db.batch()
+                    for record in rewritten[start:start + FIRESTORE_BATCH_LIMIT]:
+                        data = {k: v for k, v in record.items() if k != 'id'}
+                        batch.set(db.collection(VER_COL).document(record['id']), data)
+                    batch.commit()
+            elif USE_SQLITE:
+                with sqlite_module.transaction() as conn:
+                    conn.executemany(
+                        "UPDATE versions SET content = '', encoding = ?, base_no = ?, payload = ?, size = ? WHERE id = ?",
+                        [(r['encoding'], r['base_no'], r['payload'], r['size'], r['id']) for r in rewritten])
+            else:
+                _commit([_put('versions', r['id'], {k: v for k, v in r.items() if k != 'id'}) for r in rewritten])
+            converted += len(rewritten)
+        logger.info('Compressed %d stored versions', converted)
+        return converted
 
 
 def list_all_tags():
-    tags = set()
-    if USE_FIRESTORE:
-        docs = db.collection(ART_COL).stream()
-        for d in docs:
-            for t in d.to_dict().get('tags', []):
-                tags.add(t)
-    else:
-        for v in _ART_STORE.values():
-            for t in v.get('tags', []):
-                tags.add(t)
-    return sorted(tags)
+    return sorted(_tag_counts())
+
+
+def suggest_tags(query, limit=10, fuzzy=False):
+    """(tag, count) pairs for tag autocomplete, most used first among
+    prefix matches, then substring matches, then near misses if `fuzzy`."""
+    if USE_FIRESTORE or USE_SQLITE:
+        now = time.monotonic()
+        if _TAGS.built_at is None or now - _TAGS.built_at > TAG_INDEX_TTL:
+            _TAGS.rebuild(_tag_counts())
+            _TAGS.built_at = now
+    return _TAGS.complete(query, limit, fuzzy)
+
+
+def tag_color(tag):
+    """Badge color for a tag in the cloud and in suggestions."""
+    colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#FFA07A', '#98D8C8', '#F7DC6F', '#BB8FCE', '#85C1E2']
+    return colors[hash(tag) % len(colors)]
 
 
 def get_tag_cloud():
     """Get all tags with usage counts, sorted by frequency."""
-    tag_counts = {}
-    if USE_FIRESTORE:
-        docs = db.collection(ART_COL).stream()
-        for d in docs:
-            for t in d.to_dict().get('tags', []):
-                tag_counts[t] = tag_counts.get(t, 0) + 1
-    else:
-        for v in _ART_STORE.values():
-            for t in v.get('tags', []):
-                tag_counts[t] = tag_counts.get(t, 0) + 1
+    global _TAG_CLOUD
+    json_backend = not USE_FIRESTORE and not USE_SQLITE
+    if json_backend and _TAG_CLOUD is not None:
+        return list(_TAG_CLOUD)
 
-    colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#FFA07A', '#98D8C8', '#F7DC6F', '#BB8FCE', '#85C1E2']
+    generation = _TAG_GENERATION
+    tag_counts = _tag_counts()
+    min_count = min(tag_counts.values(), default=0)
+    max_count = max(tag_counts.values(), default=0)
     tag_list = []
     for tag in sorted(tag_counts.keys()):
-        color = colors[hash(tag) % len(colors)]
         tag_list.append({
             'tag': tag,
             'count': tag_counts[tag],
-            'color': color,
-            'size_class': _get_tag_size_class(tag_counts[tag], tag_counts),
+            'color': tag_color(tag),
+            'size_class': _get_tag_size_class(tag_counts[tag], min_count, max_count),
         })
-    return sorted(tag_list, key=lambda x: x['count'], reverse=True)
+    tag_list.sort(key=lambda x: x['count'], reverse=True)
+    if json_backend and generation == _TAG_GENERATION:
+        _TAG_CLOUD = tag_list
+    return list(tag_list)
 
 
-def _get_tag_size_class(count, all_counts):
+def _get_tag_size_class(count, min_count, max_count):
     """Determine CSS size class based on usage frequency."""
-    if not all_counts:
-        return 'md'
-    max_count = max(all_counts.values())
-    min_count = min(all_counts.values())
     if max_count == min_count:
         return 'md'
     range_count = max_count - min_count
@@ -2,9 +2,22 @@
 Whoosh full-text search module.
 Falls back to simple substring search if Whoosh is not available.
 """
+import os
+import time
+import atexit
 import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 
+from utils.journal import replace_file
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -19,11 +32,29 @@ except ImportError:
 _index = None
 _index_dir = None
 
+# Background indexing queue. Saves enqueue and return; a worker thread
+# coalesces pending changes per article id and commits them in batches.
+BATCH_SIZE = 100        # commit once this many articles are pending...
+BATCH_DELAY = 0.5       # ...or this many seconds after the first one arrived
+MERGE_EVERY = 20        # merge small segments every N batch commits
+WRITER_TIMEOUT = 30.0   # seconds to wait for another process's write lock
+MAX_ATTEMPTS = 5        # tries per batch before it is dropped, a second apart
+
+_queue = threading.Condition()
+_pending = {}           # article id -> article dict, or None to delete
+_enqueued = 0           # sequence number of the latest enqueued change
+_committed = 0          # sequence number covered by the latest commit
+_flushing = 0           # callers waiting in flush(); skip the batch delay
+_worker = None
+_batches = 0
+
 
 def get_schema():
     """Define the Whoosh schema for articles."""
     return Schema(
         id=ID(stored=True, unique=True),
+        # "<id>|<updated_at>": read back from the lexicon by reconcile_index
+        fingerprint=ID(),
         title=TEXT(stored=True),
         content=TEXT(stored=True),
         tags=KEYWORD(stored=True, commas=True, lowercase=True),
@@ -32,11 +63,18 @@ def get_schema():
 
 def init_search(app):
     """Initialize or open the Whoosh index. Call after app creation."""
-    global _index, _index_dir
+    global _index, _index_dir, BATCH_SIZE, BATCH_DELAY, MERGE_EVERY
 
     if not WHOOSH_AVAILABLE:
         return
 
+    # Drain changes queued against a previously opened index.
+    if not flush(timeout=WRITER_TIMEOUT):
+        logger.warning('Search index changes still pending after %.0fs; continuing', WRITER_TIMEOUT)
+    BATCH_SIZE = app.config.get('SEARCH_BATCH_SIZE', BATCH_SIZE)
+    BATCH_DELAY = app.config.get('SEARCH_BATCH_DELAY', BATCH_DELAY)
+    MERGE_EVERY = app.config.get('SEARCH_MERGE_EVERY', MERGE_EVERY)
+
     _index_dir = Path(app.config.get('SEARCH_INDEX_DIR',
                       Path(__file__).parent / 'data' / 'search_index'))
     _index_dir.mkdir(parents=True, exist_ok=True)
@@ -46,51 +84,240 @@ def init_search(app):
     if exists_in(index_dir_str):
         _index = open_dir(index_dir_str)
         logger.info('Opened existing Whoosh index at %s', index_dir_str)
+        if 'fingerprint' not in _index.schema:
+            # Index predates fingerprints; start over so reconcile_index fills it.
+            _index = create_in(index_dir_str, get_schema())
+            _marker_path().unlink(missing_ok=True)
+            logger.info('Recreated Whoosh index at %s with the current schema', index_dir_str)
     else:
         _index = create_in(index_dir_str, get_schema())
         logger.info('Created new Whoosh index at %s', index_dir_str)
 
 
-def rebuild_index(articles):
-    """Rebuild the index from scratch with all articles."""
+def normalize_stamp(value):
+    """An updated_at value as text that doesn't depend on how the backend
+    returned it: UTC ISO 8601 without an offset. Aware datetimes (Firestore
+    reads) are converted to UTC; naive ones and text are UTC already."""
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if not isinstance(value, datetime):
+        return ''
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    # A plain datetime, so subclasses such as Firestore's format the same.
+    return datetime(value.year, value.month, value.day, value.hour, value.minute, value.second,
+                    value.microsecond).isoformat()
+
+
+def document_stamp(article):
+    """The version marker stored with an indexed article."""
+    return normalize_stamp(article.get('updated_at'))
+
+
+def _document_fields(article):
+    article_id = str(article['id'])
+    return {
+        'id': article_id,
+        'fingerprint': f'{article_id}|{document_stamp(article)}',
+        'title': article.get('title', ''),
+        'content': article.get('content', ''),
+        'tags': ','.join(article.get('tags', [])),
+    }
+
+
+def _indexed_stamps():
+    """Map each live indexed article id to the stamp it was indexed at."""
+    stamps = {}
+    with _index.searcher() as searcher:
+        reader = searcher.reader()
+        check_deleted = reader.has_deletions()
+        for term in reader.lexicon('fingerprint'):
+            # Terms of deleted documents linger until segments are merged.
+            if check_deleted and not reader.postings('fingerprint', term).is_active():
+                continue
+            article_id, _, stamp = term.decode('utf-8').partition('|')
+            stamps[article_id] = stamp
+    return stamps
+
+
+@contextmanager
+def _reconcile_lock():
+    """Serialize reconciliation between worker processes."""
+    fd = os.open(_index_dir / 'reconcile.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _marker_path():
+    """File holding the store generation the index was last reconciled at."""
+    return _index_dir / 'reconciled'
+
+
+def reconcile_index(get_stamps, load_article, get_generation=None):
+    """Bring the index in line with the store, touching only what changed.
+
+    `get_stamps()` maps every article id to its `document_stamp` and
+    `load_article(id)` fetches one article for re-indexing. Every worker
+    calls this as it starts, one at a time. With `get_generation()`, the
+    store generation is recorded once the index has caught up, and workers
+    that find the store still at it skip the scan; a worker restarted after
+    a crash sees later writes moved it, and repairs what its predecessor had
+    queued but not committed. Returns a report dict, or None without an
+    index or when skipped.
+    """
     if not WHOOSH_AVAILABLE or _index is None:
-        return
+        return None
 
-    writer = _index.writer()
-    for article in articles:
-        writer.update_document(
-            id=str(article['id']),
-            title=article.get('title', ''),
-            content=article.get('content', ''),
-            tags=','.join(article.get('tags', [])),
-        )
-    writer.commit()
-    logger.info('Rebuilt Whoosh index with %d articles', len(articles))
+    with _reconcile_lock():
+        generation = get_generation() if get_generation else None
+        marker = _marker_path()
+        if generation is not None and marker.exists() and marker.read_text(encoding='utf-8') == generation:
+            logger.info('Search index already reconciled at store generation %s', generation)
+            return None
+        wanted = get_stamps()
+        indexed = _indexed_stamps()
+        stale = [aid for aid, stamp in wanted.items() if indexed.get(aid) != stamp]
+        orphans = [aid for aid in indexed if aid not in wanted]
+
+        reindexed = 0
+        if stale or orphans:
+            writer = _index.writer(timeout=WRITER_TIMEOUT)
+            for article_id in stale:
+                article = load_article(article_id)
+                if article:
+                    writer.update_document(**_document_fields(article))
+                    reindexed += 1
+            for article_id in orphans:
+                writer.delete_by_term('id', article_id)
+            writer.commit()
+
+        report = {
+            'indexed': reindexed,
+            'deleted': len(orphans),
+            'unchanged': len(wanted) - len(stale),
+        }
+        logger.info('Reconciled search index: %(indexed)d re-indexed, %(deleted)d deleted, '
+                    '%(unchanged)d unchanged', report)
+        if generation is not None:
+            replace_file(marker, generation.encode('utf-8'))
+        return report
 
 
 def add_to_index(article):
-    """Add or update a single article in the index."""
+    """Queue a single article to be added or updated in the index."""
     if not WHOOSH_AVAILABLE or _index is None:
         return
-
-    writer = _index.writer()
-    writer.update_document(
-        id=str(article['id']),
-        title=article.get('title', ''),
-        content=article.get('content', ''),
-        tags=','.join(article.get('tags', [])),
-    )
-    writer.commit()
+    _enqueue(str(article['id']), article)
 
 
 def remove_from_index(article_id):
-    """Remove an article from the index by ID."""
+    """Queue an article's removal from the index."""
     if not WHOOSH_AVAILABLE or _index is None:
         return
+    _enqueue(str(article_id), None)
+
+
+def _enqueue(article_id, article):
+    global _enqueued, _worker
+    with _queue:
+        # Re-inserting moves the id to the end; only the latest change is kept.
+        _pending.pop(article_id, None)
+        _pending[article_id] = article
+        _enqueued += 1
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_queue, name='search-indexer', daemon=True)
+            _worker.start()
+        _queue.notify_all()
+
+
+def _run_queue():
+    global _pending, _committed
+    attempts = 0
+    while True:
+        with _queue:
+            while not _pending:
+                _queue.wait()
+            deadline = time.monotonic() + BATCH_DELAY
+            while len(_pending) < BATCH_SIZE and not _flushing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _queue.wait(remaining)
+            batch, _pending = _pending, {}
+            upto = _enqueued
+        try:
+            _write_batch(batch)
+        except Exception:
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS:
+                # Give up rather than hold flush() forever; reconciliation at
+                # the next start re-indexes what was dropped.
+                logger.exception('Dropping search index batch of %d after %d attempts', len(batch), attempts)
+                attempts = 0
+                with _queue:
+                    _committed = upto
+                    _queue.notify_all()
+                continue
+            logger.exception('Search index batch of %d failed; will retry', len(batch))
+            with _queue:
+                # Keep anything re-queued meanwhile: it is newer.
+                for article_id, article in batch.items():
+                    if article_id not in _pending:
+                        _pending[article_id] = article
+            time.sleep(1.0)
+            continue
+        attempts = 0
+        with _queue:
+            _committed = upto
+            _queue.notify_all()
+
+
+def _write_batch(batch):
+    global _batches
+    writer = _index.writer(timeout=WRITER_TIMEOUT)
+    for article_id, article in batch.items():
+        if article is None:
+            writer.delete_by_term('id', article_id)
+        else:
+            writer.update_document(**_document_fields(article))
+    _batches += 1
+    # Each commit adds a segment; fold small ones together now and then.
+    writer.commit(merge=_batches % MERGE_EVERY == 0)
+    logger.debug('Committed search index batch of %d', len(batch))
+
+
+def flush(timeout=None):
+    """Block until every change queued so far is committed.
+
+    Returns False if `timeout` seconds pass first.
+    """
+    global _flushing
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _queue:
+        target = _enqueued
+        _flushing += 1
+        _queue.notify_all()
+        try:
+            while _committed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                _queue.wait(remaining)
+        finally:
+            _flushing -= 1
+    return True
+
 
-    writer = _index.writer()
-    writer.delete_by_term('id', str(article_id))
-    writer.commit()
+# Don't drop queued changes on a clean shutdown; startup reconciliation
+# repairs the index after a crash.
+atexit.register(flush, timeout=10)
 
 
 def search(query_string, limit=50):
@@ -0,0 +1,176 @@
+"""
+SQLite storage module.
+Keeps articles, versions and users in a local WAL-mode database that all
+Gunicorn workers share. Connections are opened lazily, one per thread.
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from utils.parser import link_targets, normalize_title
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id          TEXT PRIMARY KEY,
+    title       TEXT NOT NULL,
+    title_norm  TEXT NOT NULL DEFAULT '',
+    content     TEXT NOT NULL DEFAULT '',
+    links       TEXT NOT NULL DEFAULT '[]',
+    tags        TEXT NOT NULL DEFAULT '[]',
+    created_by  TEXT,
+    created_at  TEXT,
+    updated_by  TEXT,
+    updated_at  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_articles_title ON articles (title);
+CREATE INDEX IF NOT EXISTS idx_articles_title_norm ON articles (title_norm);
+DROP INDEX IF EXISTS idx_articles_updated_at;
+CREATE INDEX IF NOT EXISTS idx_articles_updated ON articles (updated_at, id);
+
+CREATE TABLE IF NOT EXISTS article_tags (
+    article_id  TEXT NOT NULL REFERENCES articles (id) ON DELETE CASCADE,
+    tag         TEXT NOT NULL,
+    PRIMARY KEY (tag, article_id)
+);
+CREATE INDEX IF NOT EXISTS idx_article_tags_article ON article_tags (article_id);
+
+CREATE TABLE IF NOT EXISTS versions (
+    id          TEXT PRIMARY KEY,
+    article_id  TEXT NOT NULL,
+    version_no  INTEGER NOT NULL,
+    content     TEXT NOT NULL DEFAULT '',
+    encoding    TEXT NOT NULL DEFAULT '',
+    base_no     INTEGER,
+    payload     TEXT,
+    size        INTEGER,
+    edited_at   TEXT,
+    edited_by   TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_versions_article_no ON versions (article_id, version_no);
+
+CREATE TABLE IF NOT EXISTS users (
+    id            TEXT PRIMARY KEY,
+    username      TEXT NOT NULL,
+    email         TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at    TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email);
+
+-- Bumped by every change to articles, tags or versions: a store-wide
+-- validator for HTTP caching that all processes agree on.
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT PRIMARY KEY,
+    value       INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+CREATE TRIGGER IF NOT EXISTS articles_insert_generation AFTER INSERT ON articles
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS articles_update_generation AFTER UPDATE ON articles
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS articles_delete_generation AFTER DELETE ON articles
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS versions_insert_generation AFTER INSERT ON versions
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS versions_delete_generation AFTER DELETE ON versions
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'generation'; END;
+"""
+
+# Columns added after a table was first created:
+# table -> [(column, declaration, statement that backfills existing rows)]
+ADDED_COLUMNS = {
+    'articles': [
+        ('title_norm', "TEXT NOT NULL DEFAULT ''", 'UPDATE articles SET title_norm = normalize_title(title)'),
+        ('links', "TEXT NOT NULL DEFAULT '[]'", 'UPDATE articles SET links = link_targets(content)'),
+    ],
+    'versions': [
+        ('encoding', "TEXT NOT NULL DEFAULT ''", None),
+        ('base_no', 'INTEGER', None),
+        ('payload', 'TEXT', None),
+        ('size', 'INTEGER', "UPDATE versions SET size = length(content) WHERE encoding = ''"),
+    ],
+}
+
+_db_path = None
+_local = threading.local()
+_watch = None  # (pid, path, connection) polled by data_version()
+_watch_lock = threading.Lock()
+
+
+def init_db(path):
+    """Point the module at a database file and create the schema."""
+    global _db_path
+    _db_path = str(path)
+    Path(_db_path).parent.mkdir(parents=True, exist_ok=True)
+    _local.__dict__.clear()
+    conn = get_db()
+    _add_missing_columns(conn)
+    conn.executescript(SCHEMA)
+    logger.info('SQLite database ready at %s', _db_path)
+
+
+def _add_missing_columns(conn):
+    """Bring tables created by an older schema up to date."""
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {r[1] for r in conn.execute(f'PRAGMA table_info({table})')}
+        if not existing:
+            continue
+        for name, decl, backfill in columns:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+                if backfill:
+                    conn.execute(backfill)
+                logger.info('Added column %s.%s', table, name)
+
+
+def get_db():
+    """Return this thread's connection, reopening it after a fork."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == _db_path:
+        return conn
+    conn = sqlite3.connect(_db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.create_function('normalize_title', 1, normalize_title, deterministic=True)
+    conn.create_function('link_targets', 1, lambda content: json.dumps(link_targets(content)), deterministic=True)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.path = _db_path
+    return conn
+
+
+@contextmanager
+def transaction():
+    """Run a block in an IMMEDIATE transaction so read-modify-write is atomic."""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def data_version():
+    """A value that changes whenever anyone commits to the database.
+
+    PRAGMA data_version only counts commits made through other connections,
+    so it is read on a connection of its own that never writes.
+    """
+    global _watch
+    with _watch_lock:
+        if _watch is None or _watch[0] != os.getpid() or _watch[1] != _db_path:
+            conn = sqlite3.connect(_db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            _watch = (os.getpid(), _db_path, conn)
+        pid, path, conn = _watch
+        return pid, path, conn.execute('PRAGMA data_version').fetchone()[0]
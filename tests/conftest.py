@@ -34,6 +34,10 @@ def app():
 
     yield test_app
 
+    # Let queued search index writes land before their directory goes away
+    import search
+    search.flush(timeout=10)
+
     # Cleanup: remove test data directory
     from config import TestingConfig
     test_data_dir = Path(TestingConfig.DATA_DIR)
@@ -44,6 +48,20 @@ def app():
     firebase_module.db = original_db
 
 
+@pytest.fixture(scope='function')
+def sqlite_app(app):
+    """The test app switched over to the SQLite backend."""
+    import models
+    import auth
+    app.config['STORAGE_BACKEND'] = 'sqlite'
+    models.init_models(app)
+    auth.init_auth(app)
+    yield app
+    app.config['STORAGE_BACKEND'] = ''
+    models.init_models(app)
+    auth.init_auth(app)
+
+
 @pytest.fixture(scope='function')
 def client(app):
     """Flask test client."""
@@ -60,6 +78,8 @@ def sample_article(app):
         tags=['test', 'sample'],
         created_by='testuser',
     )
+    import search
+    search.flush(timeout=10)
     return article
 
 
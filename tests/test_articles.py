@@ -1,4 +1,8 @@
 """Tests for article CRUD operations."""
+import gzip
+import re
+
+import models
 
 
 def test_index_page(client):
@@ -60,3 +64,237 @@ def test_view_nonexistent_article(client):
     """Viewing a non-existent article returns 404."""
     resp = client.get('/articles/view?article_id=nonexistent-uuid')
     assert resp.status_code == 404
+
+
+def test_get_article_by_title_tracks_renames(app, sample_article):
+    """The title index follows renames and deletes."""
+    aid = sample_article['id']
+    assert models.get_article_by_title('Test Article')['id'] == aid
+    models.update_article(aid, 'Renamed Article', '<p>x</p>', [])
+    assert models.get_article_by_title('Test Article') is None
+    assert models.get_article_by_title('Renamed Article')['id'] == aid
+    models.delete_article(aid)
+    assert models.get_article_by_title('Renamed Article') is None
+
+
+def test_get_article_by_title_normalized(app, sample_article):
+    """Lookups fall back to a case- and whitespace-folded match."""
+    found = models.get_article_by_title('  test   ARTICLE ')
+    assert found['id'] == sample_article['id']
+
+
+def test_view_article_by_lowercase_title(client, sample_article):
+    resp = client.get('/articles/view?title=test+article')
+    assert resp.status_code == 200
+    assert b'Test Article' in resp.data
+
+
+def test_list_articles_pages_by_cursor(app):
+    """Keyset pages cover every article once, newest first, and follow edits."""
+    ids = [models.create_article(f'Page {i}', '', [])['id'] for i in range(5)]
+    models.update_article(ids[0], 'Page 0', 'edited', [])
+    expected = [ids[0]] + ids[:0:-1]
+    seen, after = [], None
+    while True:
+        page = models.list_articles(limit=2, after=after)
+        if not page:
+            break
+        seen.extend(a['id'] for a in page)
+        after = models.article_cursor(page[-1])
+    assert seen == expected
+    models.delete_article(ids[4])
+    assert [a['id'] for a in models.list_articles(limit=2)] == [ids[0], ids[3]]
+
+
+def test_api_articles_next_cursor(client, app):
+    for i in range(3):
+        models.create_article(f'Api {i}', '', [])
+    first = client.get('/api/articles?limit=2').get_json()
+    assert len(first['articles']) == 2 and first['next']
+    rest = client.get('/api/articles', query_string={'limit': 2, 'after': first['next']}).get_json()
+    assert len(rest['articles']) == 1 and rest['next'] is None
+
+
+def test_autocomplete_ranks_prefix_before_substring(client, app):
+    """Every title is searchable; title prefixes beat word prefixes beat substrings."""
+    models.create_article('Learning Notes', '', [])
+    models.create_article('Machine Learning', '', [])
+    models.create_article('Unlearning Habits', '', [])
+    resp = client.get('/api/articles/autocomplete?q=learn')
+    assert resp.get_json()['suggestions'] == ['Learning Notes', 'Machine Learning', 'Unlearning Habits']
+
+
+def test_autocomplete_follows_renames_and_deletes(client, app, sample_article):
+    models.update_article(sample_article['id'], 'Quantum Field', '', [])
+    assert models.complete_titles('test') == []
+    assert models.complete_titles('quant') == ['Quantum Field']
+    models.delete_article(sample_article['id'])
+    assert models.complete_titles('quant') == []
+
+
+def test_get_articles_by_titles(app, sample_article):
+    found = models.get_articles_by_titles(['Test Article', 'test  article', 'Nope', 'Test Article'])
+    assert set(found) == {'Test Article', 'test  article'}
+    assert found['test  article']['id'] == sample_article['id']
+
+
+def test_validate_links_batches_lookups(client, sample_article):
+    resp = client.post('/api/links/validate',
+                       json={'content': '[[Test Article]] [[missing]] [[ test article ]] [[missing]]'})
+    data = resp.get_json()
+    assert data['valid'] == ['Test Article', ' test article ']
+    assert data['missing'] == ['missing']
+    assert data['total'] == 4
+
+
+def test_view_marks_missing_links_red(client, app):
+    """Links to missing pages render as red links until the page exists."""
+    page = models.create_article('Hub', '<p>[[Spoke]] and [[Hub]]</p>', [])
+    resp = client.get(f"/articles/view?article_id={page['id']}")
+    assert b'red-link' in resp.data and b'>Spoke</a>' in resp.data
+
+    spoke = models.create_article('Spoke', '', [])
+    assert 'red-link' not in models.render_article(models.get_article(page['id']))
+    models.update_article(spoke['id'], 'Wheel', '', [])
+    assert 'red-link' in models.render_article(models.get_article(page['id']))
+
+
+def test_render_cache_follows_article_edits(app):
+    page = models.create_article('Cached', '<p>one</p>', [])
+    assert 'one' in models.render_article(models.get_article(page['id']))
+    hits = models._RENDERED.hits
+    models.render_article(models.get_article(page['id']))
+    assert models._RENDERED.hits == hits + 1
+    models.update_article(page['id'], 'Cached', '<p>two</p>', [])
+    html = models.render_article(models.get_article(page['id']))
+    assert 'two' in html and 'one' not in html
+
+
+def test_backlinks_orphans_and_wanted(client, app):
+    """The link graph follows creates, edits, restores and deletes."""
+    hub = models.create_article('Hub', '[[Spoke]] [[Ghost]]', [])
+    spoke = models.create_article('Spoke', '[[hub]] [[Ghost]] [[Spoke]]', [])
+    lonely = models.create_article('Lonely', '[[Lonely]]', [])
+
+    data = client.get(f"/api/articles/{spoke['id']}/backlinks").get_json()
+    assert data['backlinks'] == [{'id': hub['id'], 'title': 'Hub'}]
+    assert client.get('/api/articles/orphans').get_json()['orphans'] == [{'id': lonely['id'], 'title': 'Lonely'}]
+    assert client.get('/api/articles/wanted').get_json()['wanted'] == [{'title': 'Ghost', 'count': 2}]
+
+    ghost = models.create_article('Ghost', '', [])
+    assert models.list_wanted() == []
+    models.update_article(hub['id'], 'Hub', 'no links', [])
+    assert {o['id'] for o in models.list_orphans()} == {lonely['id'], spoke['id']}
+    assert [b['id'] for b in models.get_backlinks(models.get_article(ghost['id']))] == [spoke['id']]
+    models.delete_article(spoke['id'])
+    assert {o['id'] for o in models.list_orphans()} == {lonely['id'], hub['id'], ghost['id']}
+
+    version = models.get_versions(hub['id'])[0]
+    models.restore_version(hub['id'], version['id'])
+    assert models.list_wanted() == [{'title': 'Spoke', 'count': 1}]
+
+
+def test_sanitize_skips_content_already_clean(app, monkeypatch):
+    """Saved content passed back in (versions, restores) is not parsed again."""
+    cleaned = models.sanitize_html('<p onclick="x()">hi<script>bad()</script></p>')
+    assert cleaned == '<p>hi' + 'bad()</p>'
+    page = models.create_article('Memo', '<p>memo test: one</p>', [])
+    calls = []
+    real = models._cleaner
+
+    def counting():
+        calls.append(1)
+        return real()
+    monkeypatch.setattr(models, '_cleaner', counting)
+    assert models.sanitize_html(cleaned) == cleaned
+    models.update_article(page['id'], 'Memo', '<p>memo test: two</p>', [])
+    assert len(calls) == 1
+
+
+def test_article_reads_are_cached_and_invalidated(app, sample_article, monkeypatch):
+    calls = []
+    load = models._load_article
+    monkeypatch.setattr(models, '_load_article', lambda i: calls.append(i) or load(i))
+    article_id = sample_article['id']
+    models.get_article(article_id)
+    models.get_article(article_id)['title'] = 'Changed by caller'
+    assert models.get_article(article_id)['title'] == 'Test Article'
+    assert len(calls) == 1
+    models.update_article(article_id, 'Renamed', '<p>New</p>', ['test'])
+    assert models.get_article(article_id)['title'] == 'Renamed'
+    assert len(models.get_versions(article_id)) == 1
+    models.delete_article(article_id)
+    assert models.get_article(article_id) is None
+
+
+def test_identity_map_within_request(app, sample_article):
+    with app.test_request_context():
+        first = models.get_article(sample_article['id'])
+        assert models.get_article(sample_article['id']) is first
+        models.update_article(sample_article['id'], 'Renamed', '<p>New</p>', ['test'])
+        assert models.get_article(sample_article['id'])['title'] == 'Renamed'
+    with app.test_request_context():
+        assert models.get_article(sample_article['id']) is not first
+
+
+def test_cache_stats_endpoint(logged_in_client, sample_article):
+    logged_in_client.get(f"/articles/view?article_id={sample_article['id']}")
+    stats = logged_in_client.get('/api/stats/cache').get_json()
+    assert stats['articles']['hits'] + stats['articles']['misses'] > 0
+    assert {'renders', 'sanitize'} <= stats.keys()
+
+
+def test_fetch_all_runs_reads_together(app, sample_article):
+    import threading
+    barrier = threading.Barrier(2, timeout=5)
+
+    def read():
+        barrier.wait()  # only passes if both reads are in flight at once
+        return models.get_article(sample_article['id'])['title']
+
+    with app.test_request_context():
+        assert models.fetch_all(read, read, parallel=True) == ['Test Article', 'Test Article']
+        assert models.fetch_all(lambda: 1, lambda: 2) == [1, 2]
+
+
+def test_conditional_get_on_pages_and_api(client, sample_article):
+    url = f"/articles/view?article_id={sample_article['id']}"
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers['ETag']
+    assert 'no-cache' in first.headers['Cache-Control']
+    again = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and not again.data
+
+    api = client.get('/api/articles/autocomplete?q=Test')
+    assert 'max-age=' in api.headers['Cache-Control']
+    assert client.get('/api/articles/autocomplete?q=Test',
+                      headers={'If-None-Match': api.headers['ETag']}).status_code == 304
+
+    models.update_article(sample_article['id'], 'Test Article', '<p>Edited</p>', ['test'])
+    changed = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and b'Edited' in changed.data
+
+
+def test_versions_page_honours_if_modified_since(client, sample_article):
+    url = f"/articles/{sample_article['id']}/versions"
+    first = client.get(url)
+    assert first.headers['Last-Modified']
+    assert client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']}).status_code == 304
+
+
+def test_static_assets_fingerprinted_and_precompressed(client):
+    page = client.get('/login').get_data(as_text=True)
+    url = re.search(r'href="(/assets/css/style\.[0-9a-f]{12}\.css)"', page).group(1)
+    plain = client.get(url)
+    assert plain.status_code == 200 and 'Content-Encoding' not in plain.headers
+    assert 'immutable' in plain.headers['Cache-Control']
+    packed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(packed.data) == plain.data
+    assert 'Accept-Encoding' in packed.headers['Vary']
+
+
+def test_autocomplete_matches_short_substrings(client, app):
+    models.create_article('Beta', '<p>b</p>', [])
+    resp = client.get('/api/articles/autocomplete?q=et')
+    assert 'Beta' in resp.get_json()['suggestions']
@@ -65,3 +65,94 @@ def test_logout(logged_in_client):
     resp = logged_in_client.get('/logout', follow_redirects=True)
     assert resp.status_code == 200
     assert b'Logged out' in resp.data
+
+
+def test_user_lookups_use_indexes_and_cache(app, sample_user, monkeypatch):
+    """Username and email resolve through the indexes; ids come from the cache."""
+    import auth
+    user, _ = sample_user
+    assert auth.get_user_by_username('testuser').id == user.id
+    assert auth.get_user_by_email('test@example.com').id == user.id
+    assert auth.get_user_by_username('nobody') is None
+    monkeypatch.setattr(auth, '_load_user', lambda uid: None)
+    assert auth.get_user_by_id(user.id).username == 'testuser'
+    monkeypatch.undo()
+    auth._apply_user_record({'s': 'users', 'op': 'delete', 'id': user.id})
+    assert auth.get_user_by_id(user.id) is None
+    assert auth.get_user_by_username('testuser') is None
+
+
+def test_login_rehashes_under_new_policy(app, client, sample_user):
+    """A successful login upgrades a hash made with other parameters."""
+    import auth
+    user, password = sample_user
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    auth.init_auth(app)
+    old_hash = auth.get_user_by_id(user.id).password_hash
+    assert auth.needs_rehash(old_hash)
+    client.post('/login', data={'username': user.username, 'password': password})
+    new_hash = auth.get_user_by_id(user.id).password_hash
+    assert new_hash.startswith('pbkdf2:sha256:1000$')
+    assert not auth.needs_rehash(new_hash)
+    assert auth.get_user_by_id(user.id).check_password(password)
+    assert auth.hash_stats()['completed'] >= 3
+
+
+def test_hash_prefix_matches_werkzeug_without_hashing():
+    """The policy's hash prefix is worked out from the method string."""
+    import auth
+    from werkzeug.security import generate_password_hash
+    for method in ('scrypt', 'scrypt:16384:8:1', 'pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:1000'):
+        assert auth._hash_prefix(method) == generate_password_hash('', method).split('$', 1)[0]
+
+
+def test_login_refused_when_hashing_queue_full(app, client, sample_user, monkeypatch):
+    """Logins get a 503 instead of queueing without bound."""
+    import auth
+    from utils.executor import ExecutorBusy
+    user, password = sample_user
+
+    def busy(*args):
+        raise ExecutorBusy('full')
+    monkeypatch.setattr(auth._HASHER, 'run', busy)
+    resp = client.post('/login', data={'username': user.username, 'password': password})
+    assert resp.status_code == 503
+
+
+def test_hashing_cap_is_shared_between_processes(tmp_path):
+    """Callers in another process count against the same slots and queue."""
+    import threading
+    import time
+    import pytest
+    from utils.executor import SharedBoundedExecutor, ExecutorBusy
+    # Two executors on one directory stand in for two worker processes.
+    first = SharedBoundedExecutor(tmp_path, workers=1, max_pending=1, name='hash')
+    second = SharedBoundedExecutor(tmp_path, workers=1, max_pending=1, name='hash')
+    release = threading.Event()
+    running = threading.Event()
+
+    def slow():
+        running.set()
+        release.wait(10)
+        return 'done'
+    results = []
+    holder = threading.Thread(target=lambda: results.append(first.run(slow)))
+    holder.start()
+    assert running.wait(10)
+    waiter = threading.Thread(target=lambda: results.append(second.run(lambda: threading.current_thread().name)))
+    waiter.start()
+    deadline = time.monotonic() + 10
+    while second.stats()['queued'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    with pytest.raises(ExecutorBusy):
+        second.run(lambda: 'refused')
+    stats = first.stats()
+    assert (stats['running'], stats['queued'], stats['rejected']) == (1, 1, 1)
+
+    release.set()
+    holder.join(10)
+    waiter.join(10)
+    assert results[0] == 'done'
+    assert results[1].startswith('hash')  # ran on the pool, not the caller's thread
+    assert second.stats()['completed'] == 2
@@ -0,0 +1,41 @@
+"""Tests for the version diff engine."""
+import random
+
+from utils.diff import diff_sequences, generate_html_diff
+
+
+def test_opcodes_rebuild_target():
+    rng = random.Random(7)
+    for _ in range(200):
+        a = [rng.randint(0, 4) for _ in range(rng.randint(0, 25))]
+        b = [rng.randint(0, 4) for _ in range(rng.randint(0, 25))]
+        out = []
+        for tag, i1, i2, j1, j2 in diff_sequences(a, b):
+            if tag == 'equal':
+                assert a[i1:i2] == b[j1:j2]
+            out += b[j1:j2]
+        assert out == b
+
+
+def test_html_diff_highlights_changed_words():
+    html = generate_html_diff('the quick fox', 'the slow fox')
+    assert '<del class="diff-word">quick</del>' in html
+    assert '<ins class="diff-word">slow</ins>' in html
+    assert 'diff-word' not in generate_html_diff('the quick fox', 'the slow fox', intraline=False)
+
+
+def test_html_diff_escapes():
+    assert '&lt;script&gt;' in generate_html_diff('', '<script>')
+
+
+def test_delta_of_large_repetitive_rewrite_is_bounded():
+    """Version deltas use the bounded diff, so a rewrite can't stall writers."""
+    import time
+    from utils.delta import apply_delta, encode_delta
+    random.seed(7)
+    base = ''.join(f'<p>line {n % 50}</p>\n' for n in range(20000))
+    target = ''.join(f'<p>line {random.randrange(60)}</p>\n' for _ in range(20000))
+    started = time.monotonic()
+    payload = encode_delta(base, target)
+    assert time.monotonic() - started < 5
+    assert apply_delta(base, payload) == target
@@ -19,3 +19,83 @@ def test_search_no_results(app):
     """Search for non-matching term returns empty list."""
     results = models.search_articles('xyznonexistent')
     assert results == []
+
+
+def test_reconcile_touches_only_changed_documents(app, sample_article):
+    """Reconciliation re-indexes stale articles and drops orphans."""
+    import search
+    other = models.create_article('Other', '<p>other</p>', [])
+    search.flush()
+    report = search.reconcile_index(models.article_stamps, models.get_article)
+    assert report == {'indexed': 0, 'deleted': 0, 'unchanged': 2}
+
+    # Simulate index drift: an edit the index missed and a ghost document.
+    models._commit([models._put('articles', other['id'],
+                                {**models._ART_STORE[other['id']], 'updated_at': 'later', 'title': 'Zebra'})])
+    search.add_to_index({'id': 'ghost', 'title': 'Ghost', 'content': '', 'tags': []})
+    search.flush()
+    report = search.reconcile_index(models.article_stamps, models.get_article)
+    assert report == {'indexed': 1, 'deleted': 1, 'unchanged': 1}
+    assert [r['id'] for r in models.search_articles('Zebra')] == [other['id']]
+    assert models.search_articles('Ghost') == []
+
+
+def test_every_startup_repairs_drift(app, sample_article):
+    """A restarted worker catches up changes its predecessor never committed."""
+    import search
+    from app import create_app
+    models._commit([models._put('articles', sample_article['id'],
+                                {**models._ART_STORE[sample_article['id']], 'title': 'Quagga',
+                                 'updated_at': '2030-01-01 00:00:00'})])
+    assert models.search_articles('Quagga') == []
+    create_app('testing')
+    search.flush()
+    assert [r['id'] for r in models.search_articles('Quagga')] == [sample_article['id']]
+
+
+def test_startup_skips_reconcile_when_store_unchanged(app, sample_article, monkeypatch):
+    """Once one worker has reconciled a store generation, the next ones skip the scan."""
+    import search
+    from app import create_app
+    search.flush()
+    create_app('testing')
+    scans = []
+    monkeypatch.setattr(models, 'article_stamps', lambda: scans.append(1) or {})
+    create_app('testing')
+    assert scans == []
+    models.create_article('Later', '<p>later</p>', [])
+    search.flush()
+    monkeypatch.undo()
+    assert search.reconcile_index(models.article_stamps, models.get_article, models.store_generation) is not None
+
+
+def test_stamps_agree_across_timestamp_forms():
+    """Naive, aware and text timestamps of one instant give one stamp."""
+    from datetime import datetime, timedelta, timezone
+    from search import normalize_stamp
+    naive = datetime(2024, 5, 1, 12, 30, 0, 123456)
+    aware = naive.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=2)))
+    assert normalize_stamp(naive) == normalize_stamp(aware) == normalize_stamp(str(naive))
+    assert normalize_stamp(None) == ''
+
+
+def test_index_updates_are_queued_and_coalesced(app, sample_article):
+    """Saves return before indexing; repeated saves of one article share a commit."""
+    import search
+    aid = sample_article['id']
+    batches = search._batches
+    for word in ('apple', 'banana', 'cherry'):
+        models.update_article(aid, 'Test Article', f'<p>{word}</p>', [])
+    assert search.flush(timeout=10)
+    assert search._batches == batches + 1
+    assert [r['id'] for r in models.search_articles('cherry')] == [aid]
+    assert models.search_articles('apple') == []
+
+
+def test_failing_batch_is_dropped_after_bounded_retries(app, monkeypatch):
+    """A persistently broken index can't hold flush() forever."""
+    import search
+    monkeypatch.setattr(search, 'MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(search, '_write_batch', lambda batch: 1 / 0)
+    search.add_to_index({'id': 'doomed', 'title': 'Doomed', 'content': '', 'tags': []})
+    assert search.flush(timeout=10)
@@ -0,0 +1,134 @@
+"""Tests for the SQLite storage backend."""
+import models
+import sqlite_module
+from auth import create_user, get_user_by_email, get_user_by_username
+
+
+def test_article_crud(sqlite_app):
+    """Articles round-trip through SQLite, including tag lookups."""
+    a = models.create_article('Alpha', '<p>First</p>', ['x', 'y'])
+    assert models.get_article(a['id'])['tags'] == ['x', 'y']
+    assert models.get_article_by_title('Alpha')['id'] == a['id']
+    models.update_article(a['id'], 'Beta', '<p>Second</p>', ['y', 'z'])
+    assert models.get_article_by_title('Alpha') is None
+    assert [t['id'] for t in models.list_articles_by_tag('z')] == [a['id']]
+    assert models.list_all_tags() == ['y', 'z']
+    models.delete_article(a['id'])
+    assert models.get_article(a['id']) is None
+    assert models.list_all_tags() == []
+
+
+def test_versions_and_restore(sqlite_app):
+    """Edits create numbered versions and restore brings content back."""
+    a = models.create_article('Doc', '<p>one</p>', [])
+    models.update_article(a['id'], 'Doc', '<p>two</p>', [])
+    models.update_article(a['id'], 'Doc', '<p>three</p>', [])
+    versions = models.get_versions(a['id'])
+    assert [v['version_no'] for v in versions] == [2, 1]
+    assert models.restore_version(a['id'], versions[-1]['id'])
+    assert models.get_article(a['id'])['content'] == '<p>one</p>'
+    assert models.get_versions(a['id'])[0]['version_no'] == 3
+
+
+def test_list_articles_most_recent_first(sqlite_app):
+    first = models.create_article('First', '', [])
+    second = models.create_article('Second', '', [])
+    models.update_article(first['id'], 'First', 'edited', [])
+    assert [a['id'] for a in models.list_articles()] == [first['id'], second['id']]
+
+
+def test_users(sqlite_app):
+    """Users are stored with unique username and email."""
+    user = create_user('sql', 'sql@example.com', 'secret123')
+    assert get_user_by_username('sql').id == user.id
+    assert get_user_by_email('sql@example.com').check_password('secret123')
+    assert create_user('sql', 'other@example.com', 'secret123') is None
+
+
+def test_wal_mode(sqlite_app):
+    mode = sqlite_module.get_db().execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == 'wal'
+
+
+def test_title_lookup_normalized(sqlite_app):
+    a = models.create_article('Getting Started', '', [])
+    assert models.get_article_by_title('getting  started')['id'] == a['id']
+
+
+def test_versions_compressed(sqlite_app):
+    a = models.create_article('Doc', '<p>0</p>', [])
+    for n in range(1, 4):
+        models.update_article(a['id'], 'Doc', f'<p>{n}</p>', [])
+    rows = sqlite_module.get_db().execute(
+        'SELECT encoding, content FROM versions ORDER BY version_no').fetchall()
+    assert [r['encoding'] for r in rows] == ['zlib', 'delta', 'delta']
+    assert all(r['content'] == '' for r in rows)
+    assert [v['content'] for v in models.get_versions(a['id'])] == ['<p>2</p>', '<p>1</p>', '<p>0</p>']
+
+
+def test_list_articles_after_cursor(sqlite_app):
+    ids = [models.create_article(f'Page {i}', '', [])['id'] for i in range(3)]
+    first = models.list_articles(limit=2)
+    assert [a['id'] for a in first] == [ids[2], ids[1]]
+    rest = models.list_articles(limit=2, after=models.article_cursor(first[-1]))
+    assert [a['id'] for a in rest] == [ids[0]]
+
+
+def test_complete_titles(sqlite_app):
+    a = models.create_article('Graph Theory', '', [])
+    assert models.complete_titles('theo') == ['Graph Theory']
+    models.update_article(a['id'], 'Set Theory', '', [])
+    assert models.complete_titles('graph') == []
+    assert models.complete_titles('set') == ['Set Theory']
+
+
+def test_get_articles_by_titles(sqlite_app):
+    a = models.create_article('Alpha', '', [])
+    found = models.get_articles_by_titles(['Alpha', 'ALPHA', 'Beta'])
+    assert {t: d['id'] for t, d in found.items()} == {'Alpha': a['id'], 'ALPHA': a['id']}
+
+
+def test_link_graph(sqlite_app):
+    a = models.create_article('A', '[[B]]', [])
+    assert models.list_wanted() == [{'title': 'B', 'count': 1}]
+    b = models.create_article('B', '', [])
+    assert models.list_wanted() == []
+    assert models.get_backlinks(models.get_article(b['id'])) == [{'id': a['id'], 'title': 'A'}]
+    assert models.list_orphans() == [{'id': a['id'], 'title': 'A'}]
+
+
+def test_list_and_get_version(sqlite_app):
+    a = models.create_article('V', 'one', [])
+    models.update_article(a['id'], 'V', 'two', [])
+    [meta] = models.list_versions(a['id'])
+    assert meta['size'] == 3 and 'content' not in meta
+    assert models.get_version(meta['id'])['content'] == 'one'
+
+
+def test_cached_reads_follow_other_connections(sqlite_app):
+    import sqlite3
+    a = models.create_article('Cached', 'one', [])
+    models.refresh_store()
+    assert models.get_article(a['id'])['content'] == 'one'
+    other = sqlite3.connect(sqlite_app.config['SQLITE_PATH'])
+    other.execute("UPDATE articles SET content = 'two' WHERE id = ?", (a['id'],))
+    other.commit()
+    other.close()
+    assert models.get_article(a['id'])['content'] == 'one'
+    models.refresh_store()
+    assert models.get_article(a['id'])['content'] == 'two'
+
+
+def test_store_generation_moves_with_writes(sqlite_app):
+    before = models.store_generation()
+    a = models.create_article('Gen', 'one', [])
+    after_create = models.store_generation()
+    assert after_create != before
+    models.update_article(a['id'], 'Gen', 'two', [])
+    assert models.store_generation() != after_create
+
+
+def test_update_missing_article_is_a_no_op(sqlite_app):
+    models.update_article('no-such-id', 'Gone', 'text', ['tag'])
+    assert models.get_article('no-such-id') is None
+    assert models.list_versions('no-such-id') == []
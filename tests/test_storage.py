@@ -0,0 +1,124 @@
+"""Tests for the JSON backend's append-only journal and compaction."""
+import json
+
+import models
+
+
+def test_writes_are_journaled_not_rewritten(app, sample_article):
+    """A create appends to the journal instead of rewriting articles.json."""
+    assert models.JOURNAL_FILE.exists()
+    assert not models.ART_FILE.exists()
+    records = [json.loads(line) for line in models.JOURNAL_FILE.read_text().splitlines()]
+    assert records[-1]['op'] == 'put'
+    assert records[-1]['id'] == sample_article['id']
+
+
+def test_journal_replayed_on_init(app, sample_article):
+    """Re-initializing the models replays the journal into memory."""
+    aid = sample_article['id']
+    models.update_article(aid, 'Renamed', '<p>Changed</p>', ['x'])
+    models.init_models(app)
+    article = models.get_article(aid)
+    assert article['title'] == 'Renamed'
+    assert len(models.get_versions(aid)) == 1
+
+
+def test_compaction_folds_journal_into_snapshot(app, sample_article):
+    """Compaction writes the snapshot files and empties the journal."""
+    aid = sample_article['id']
+    models.delete_article(aid)
+    other = models.create_article('Kept', 'body', [])
+    models.compact_store()
+    assert [json.loads(line) for line in models.JOURNAL_FILE.read_text().splitlines()] == [
+        {'generation': models._JOURNAL.generation}]
+    assert set(json.loads(models.ART_FILE.read_text())) == {other['id']}
+    models.init_models(app)
+    assert models.get_article(other['id'])['title'] == 'Kept'
+    assert models.get_article(aid) is None
+
+
+def test_store_generation_survives_compaction(app, sample_article):
+    """The validator keeps rising across compactions and reloads, so an old
+    ETag can't match different content after the journal is rewritten."""
+    seen = [models.store_generation()]
+    for i in range(3):
+        models.create_article(f'Page {i}', 'body', [])
+        seen.append(models.store_generation())
+        models.compact_store()
+        models.init_models(app)
+        assert models.store_generation() == seen[-1]
+    assert [int(g) for g in seen] == sorted(set(int(g) for g in seen))
+
+
+def test_torn_journal_tail_is_ignored(app, sample_article):
+    """A partially written trailing record from a crash is discarded."""
+    with open(models.JOURNAL_FILE, 'ab') as fh:
+        fh.write(b'{"s":"articles","op":"put","id":"torn"')
+    models.init_models(app)
+    assert models.get_article(sample_article['id']) is not None
+    assert models.get_article('torn') is None
+    models.create_article('After crash', 'body', [])
+    models.init_models(app)
+    assert any(a['title'] == 'After crash' for a in models.list_articles())
+
+
+def test_unreadable_snapshot_fails_loudly(app, sample_article):
+    """A damaged snapshot raises instead of loading as an empty store."""
+    import pytest
+    models.compact_store()
+    models.ART_FILE.write_text('{"truncated": ')
+    with pytest.raises(ValueError):
+        models.init_models(app)
+
+
+def _run_in_other_worker(app, code):
+    """Run model calls in a separate process sharing the test data dir."""
+    import subprocess
+    import sys
+    from pathlib import Path
+    script = (
+        'import types, models\n'
+        f'models.init_models(types.SimpleNamespace(config={{"DATA_DIR": {app.config["DATA_DIR"]!r}, '
+        '"STORAGE_BACKEND": "json"}))\n'
+        + code
+    )
+    subprocess.run([sys.executable, '-c', script], check=True, cwd=Path(models.__file__).parent)
+
+
+def test_other_worker_writes_become_visible(app, sample_article):
+    """A cheap refresh picks up records another process appended."""
+    aid = sample_article['id']
+    _run_in_other_worker(app, f'models.update_article({aid!r}, "From Worker 2", "<p>w2</p>", ["w2"])\n')
+    assert models.get_article(aid)['title'] == 'Test Article'
+    models.refresh_store()
+    assert models.get_article(aid)['title'] == 'From Worker 2'
+    assert models.get_article_by_title('From Worker 2')['id'] == aid
+
+
+def test_no_lost_updates_between_workers(app, sample_article):
+    """Writes catch up under the journal lock, so version numbers never collide."""
+    aid = sample_article['id']
+    _run_in_other_worker(app, f'models.update_article({aid!r}, "Test Article", "<p>w2</p>", [])\n')
+    models.update_article(aid, 'Test Article', '<p>w1</p>', [])
+    assert [v['version_no'] for v in models.get_versions(aid)] == [2, 1]
+    assert models.get_versions(aid)[0]['content'] == '<p>w2</p>'
+
+
+def test_reload_after_other_worker_compacts(app, sample_article):
+    aid = sample_article['id']
+    _run_in_other_worker(app, f'models.delete_article({aid!r})\nmodels.compact_store()\n')
+    models.refresh_store()
+    assert models.get_article(aid) is None
+
+
+def test_users_registered_by_other_worker(app):
+    import auth
+    _run_in_other_worker(app, (
+        'import auth\n'
+        f'auth.init_auth(types.SimpleNamespace(config={{"DATA_DIR": {app.config["DATA_DIR"]!r}}}))\n'
+        'auth.create_user("remote", "remote@example.com", "secret123")\n'
+    ))
+    assert auth.get_user_by_username('remote') is None
+    auth.refresh_users()
+    assert auth.get_user_by_username('remote').email == 'remote@example.com'
+    assert auth.create_user('remote', 'x@example.com', 'secret123') is None
@@ -15,3 +15,40 @@ def test_filter_by_tag(client, sample_article):
     resp = client.get('/?tag=test')
     assert resp.status_code == 200
     assert b'Test Article' in resp.data
+
+
+def test_tag_index_follows_edits_and_deletes(app, sample_article):
+    """Tag filtering, the tag list and the cloud track article changes."""
+    aid = sample_article['id']
+    other = models.create_article('Other', 'x', ['test', 'extra'])
+    assert {a['id'] for a in models.list_articles_by_tag('test')} == {aid, other['id']}
+    assert {t['tag']: t['count'] for t in models.get_tag_cloud()}['test'] == 2
+
+    models.update_article(aid, 'Test Article', 'y', ['sample', 'fresh'])
+    assert [a['id'] for a in models.list_articles_by_tag('test')] == [other['id']]
+    assert models.list_all_tags() == ['extra', 'fresh', 'sample', 'test']
+
+    models.delete_article(other['id'])
+    assert models.list_articles_by_tag('test') == []
+    assert models.list_all_tags() == ['fresh', 'sample']
+
+
+def test_tag_cloud_size_classes(app):
+    for i in range(4):
+        models.create_article(f'A{i}', 'x', ['common'] + (['rare'] if i == 0 else []))
+    sizes = {t['tag']: t['size_class'] for t in models.get_tag_cloud()}
+    assert sizes == {'common': 'xl', 'rare': 'sm'}
+
+
+def test_tag_suggestions_ranked_by_usage(client, app):
+    """Prefix matches come first, most used first; substrings follow."""
+    models.create_article('A', '', ['python', 'pytest'])
+    models.create_article('B', '', ['pytest', 'cpython'])
+    b = models.create_article('C', '', ['pytest'])
+    data = client.get('/api/tags/suggestions?q=py').get_json()
+    assert [(s['tag'], s['count']) for s in data['suggestions']] == [('pytest', 3), ('python', 1), ('cpython', 1)]
+
+    models.delete_article(b['id'])
+    assert models.suggest_tags('pyte') == [('pytest', 2)]
+    assert models.suggest_tags('pyhton') == []
+    assert models.suggest_tags('pyhton', fuzzy=True)[0] == ('python', 1)
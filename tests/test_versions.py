@@ -31,3 +31,108 @@ def test_versions_page_loads(client, sample_article):
     """GET /articles/<id>/versions returns 200."""
     resp = client.get(f'/articles/{sample_article["id"]}/versions')
     assert resp.status_code == 200
+
+
+def test_version_numbers_are_per_article(app, sample_article):
+    """Each article numbers its versions independently, newest first."""
+    aid = sample_article['id']
+    other = models.create_article('Other', '<p>o</p>', [])
+    for i in range(3):
+        models.update_article(aid, 'Test Article', f'<p>edit {i}</p>', [])
+    models.update_article(other['id'], 'Other', '<p>o2</p>', [])
+    assert [v['version_no'] for v in models.get_versions(aid)] == [3, 2, 1]
+    assert [v['version_no'] for v in models.get_versions(other['id'])] == [1]
+
+
+def test_version_index_survives_reload_and_delete(app, sample_article):
+    aid = sample_article['id']
+    models.update_article(aid, 'Test Article', '<p>one</p>', [])
+    models.init_models(app)
+    assert models.add_version(aid, '<p>manual</p>')['version_no'] == 2
+    models.delete_article(aid)
+    assert models.get_versions(aid) == []
+
+
+def test_versions_stored_as_deltas_with_keyframes(app, sample_article):
+    """Stored versions are compressed deltas with periodic keyframes."""
+    aid = sample_article['id']
+    models.VERSION_KEYFRAME_INTERVAL = 3
+    body = ''.join(f'<p>line {n}</p>\n' for n in range(50))
+    for i in range(7):
+        models.update_article(aid, 'Test Article', body + f'<p>edit {i}</p>', [])
+    stored = sorted(models._VER_STORE.values(), key=lambda v: v['version_no'])
+    assert [v['encoding'] for v in stored] == ['zlib', 'delta', 'delta'] * 2 + ['zlib']
+    assert all('content' not in v for v in stored)
+
+    versions = models.get_versions(aid)
+    assert versions[-1]['content'] == sample_article['content']
+    assert versions[0]['content'] == body + '<p>edit 5</p>'
+    models.restore_version(aid, versions[2]['id'])
+    assert models.get_article(aid)['content'] == body + '<p>edit 3</p>'
+
+
+def test_compress_versions_migrates_full_content(app, sample_article):
+    """Legacy full-content versions are converted in place."""
+    aid = sample_article['id']
+    legacy = {}
+    for n in range(1, 4):
+        legacy[f'legacy-{n}'] = {
+            'article_id': aid,
+            'version_no': n,
+            'content': f'<p>legacy {n}</p>',
+            'edited_at': '2024-01-01 00:00:00',
+            'edited_by': 'System',
+        }
+    models._commit([models._put('versions', vid, v) for vid, v in legacy.items()])
+    assert models.compress_versions() == 3
+    assert models.compress_versions() == 0
+    assert all(models._VER_STORE[vid]['encoding'] for vid in legacy)
+    contents = [v['content'] for v in models.get_versions(aid)]
+    assert contents == ['<p>legacy 3</p>', '<p>legacy 2</p>', '<p>legacy 1</p>']
+
+
+
+def test_compare_versions_cached(logged_in_client, sample_article, monkeypatch):
+    """A pair of versions is diffed once; later views reuse the HTML."""
+    import app as app_module
+    calls = []
+    real = app_module.generate_html_diff
+    monkeypatch.setattr(app_module, 'generate_html_diff', lambda a, b: calls.append(1) or real(a, b))
+    aid = sample_article['id']
+    models.update_article(aid, 'Test Article', '<p>second</p>', [])
+    models.update_article(aid, 'Test Article', '<p>third</p>', [])
+    v2, v1 = models.get_versions(aid)[:2]
+    url = f"/articles/{aid}/compare?v1={v1['id']}&v2={v2['id']}"
+    first = logged_in_client.get(url)
+    assert first.status_code == 200
+    assert logged_in_client.get(url).data == first.data
+    assert len(calls) == 1
+
+
+def test_list_versions_metadata_only(app, sample_article):
+    aid = sample_article['id']
+    models.update_article(aid, 'Test Article', '<p>second</p>', [])
+    models.update_article(aid, 'Test Article', '<p>third</p>', [])
+    listed = models.list_versions(aid)
+    assert [v['version_no'] for v in listed] == [2, 1]
+    assert all('content' not in v for v in listed)
+    full = models.get_versions(aid)
+    assert [v['size'] for v in listed] == [len(v['content']) for v in full]
+    assert models.get_version(listed[0]['id'])['content'] == full[0]['content']
+    assert models.get_version('missing') is None
+
+
+def test_broken_delta_chain_fails_loudly(app, sample_article):
+    """A gap in the delta chain raises instead of restoring empty content."""
+    import pytest
+    article_id = sample_article['id']
+    for text in ('<p>two</p>', '<p>three</p>', '<p>four</p>'):
+        models.update_article(article_id, 'Test Article', text, ['test'])
+    metas = models.list_versions(article_id)  # newest first
+    middle, newest = metas[1], metas[0]
+    models._commit([models._delete('versions', middle['id'])])
+    with pytest.raises(models.VersionChainError):
+        models.get_version(newest['id'])
+    with pytest.raises(models.VersionChainError):
+        models.restore_version(article_id, newest['id'])
+    assert models.get_article(article_id)['content'] == '<p>four</p>'
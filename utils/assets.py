@@ -0,0 +1,111 @@
+"""
+Fingerprinted, precompressed static assets.
+
+At startup every stylesheet and script under static/ is copied into a build
+directory under a name carrying a hash of its content, next to gzip and
+(when the brotli package is installed) brotli variants. Templates link to
+them with asset_url(), and /assets/ serves the variant the browser accepts
+with a year-long immutable lifetime: a changed file gets a new URL, so a
+cached copy never needs revalidating.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from pathlib import Path
+
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ASSET_SUFFIXES = ('.css', '.js')
+CACHE_SECONDS = 365 * 24 * 3600
+# (file suffix, Content-Encoding) of the precompressed variants, preferred first
+ENCODINGS = [('.br', 'br'), ('.gz', 'gzip')]
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def _write(path, data):
+    """Write a build output once; names are content-addressed, so an existing
+    file already holds the right bytes. Atomic, as workers build at once."""
+    if path.exists():
+        return
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def build_assets(source_dir, build_dir):
+    """Fingerprint and compress the assets under `source_dir` into `build_dir`.
+
+    Returns the manifest: each asset's path relative to `source_dir` mapped
+    to its fingerprinted path relative to `build_dir`.
+    """
+    source_dir, build_dir = Path(source_dir).resolve(), Path(build_dir).resolve()
+    manifest = {}
+    for src in sorted(source_dir.rglob('*')):
+        if src.suffix not in ASSET_SUFFIXES or not src.is_file() or build_dir in src.parents:
+            continue
+        rel = src.relative_to(source_dir)
+        data = src.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        built = rel.with_name(f'{rel.stem}.{digest}{rel.suffix}')
+        out = build_dir / built
+        out.parent.mkdir(parents=True, exist_ok=True)
+        _write(out, data)
+        for suffix, encoding in ENCODINGS:
+            packed = _compress(data, encoding)
+            if packed is not None and len(packed) < len(data):
+                _write(out.with_name(out.name + suffix), packed)
+        manifest[rel.as_posix()] = built.as_posix()
+    return manifest
+
+
+def init_assets(app):
+    """Build the assets and register the asset_url() helper and /assets/ route."""
+    build_dir = Path(app.config.get('ASSET_BUILD_DIR') or Path(app.static_folder) / 'dist')
+    manifest = build_assets(app.static_folder, build_dir)
+    logger.info('Built %d static assets into %s (brotli %s)', len(manifest), build_dir,
+                'on' if brotli is not None else 'unavailable')
+
+    def asset_url(filename):
+        """URL of the fingerprinted copy of static/`filename`."""
+        built = manifest.get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('asset', filename=built)
+
+    def asset(filename):
+        path = safe_join(str(build_dir), filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0]
+        encoding = None
+        for suffix, name in ENCODINGS:
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, name
+                break
+        response = send_file(path, mimetype=mimetype, max_age=CACHE_SECONDS)
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.add_url_rule('/assets/<path:filename>', 'asset', asset)
+    app.add_template_global(asset_url)
@@ -0,0 +1,76 @@
+"""
+Small in-process caches.
+
+LRUCache bounds memory by entry count and evicts the least recently used
+entry; an optional TTL bounds how stale an entry may get when other workers
+can change the underlying data without this process noticing.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with optional per-entry expiry.
+
+    `on_evict(key, value)` is called for entries dropped to make room or on
+    expiry, but not for explicit pop() or clear().
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()   # key -> (expires at or None, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        evicted = None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                evicted, entry = (key, entry[1]), None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if evicted and self.on_evict:
+            self.on_evict(*evicted)
+        return default if entry is None else entry[1]
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        evicted = []
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+        if self.on_evict:
+            for item in evicted:
+                self.on_evict(*item)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,195 @@
+"""
+In-memory completion indexes for the editor's autocomplete endpoints.
+
+Titles are kept in a sorted list of word-start suffixes, so every prefix
+query is a bisect followed by a walk over the matching range, plus an index
+of every 1- to 3-character substring that answers substring queries without
+scanning all titles. Both are
+updated one title at a time as articles are created, renamed and deleted.
+
+Tags get a smaller structure of the same kind: the vocabulary sorted by its
+case-folded form, with usage counts, so suggestions never touch articles.
+"""
+import bisect
+import difflib
+import heapq
+import threading
+
+from utils.parser import normalize_title
+
+_EMPTY = frozenset()
+
+
+def _word_starts(norm):
+    """Suffixes of a normalized title beginning at each word."""
+    out = [norm]
+    for i, ch in enumerate(norm):
+        if ch == ' ':
+            out.append(norm[i + 1:])
+    return out
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _grams(text):
+    """Every substring of `text` up to 3 characters long: a query that short
+    is looked up directly, longer ones through their trigrams."""
+    return {text[i:i + n] for n in (1, 2, 3) for i in range(len(text) - n + 1)}
+
+
+class TitleIndex:
+    """Ranked title completion over every article.
+
+    Matches at the start of the title come first, then matches at the start
+    of a later word, then matches anywhere; ties go to the most recently
+    updated article.
+    """
+
+    def __init__(self):
+        self._docs = {}      # id -> (title, normalized title, updated_at stamp)
+        self._starts = []    # sorted (word-start suffix, id)
+        self._grams = {}     # substring of up to 3 characters -> ids
+        self._lock = threading.Lock()
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def rebuild(self, items):
+        """Replace the contents with `items`, an iterable of (id, title, stamp)."""
+        docs, starts, grams = {}, [], {}
+        for doc_id, title, stamp in items:
+            norm = normalize_title(title or '')
+            docs[doc_id] = (title, norm, stamp)
+            starts.extend((s, doc_id) for s in _word_starts(norm))
+            for gram in _grams(norm):
+                grams.setdefault(gram, set()).add(doc_id)
+        starts.sort()
+        with self._lock:
+            self._docs, self._starts, self._grams = docs, starts, grams
+
+    def put(self, doc_id, title, stamp):
+        """Add or update one title. A change of stamp alone is O(1)."""
+        norm = normalize_title(title or '')
+        with self._lock:
+            old = self._docs.get(doc_id)
+            if old is not None and old[1] == norm:
+                self._docs[doc_id] = (title, norm, stamp)
+                return
+            if old is not None:
+                self._unlink(doc_id, old[1])
+            self._docs[doc_id] = (title, norm, stamp)
+            for s in _word_starts(norm):
+                bisect.insort(self._starts, (s, doc_id))
+            for gram in _grams(norm):
+                self._grams.setdefault(gram, set()).add(doc_id)
+
+    def discard(self, doc_id):
+        with self._lock:
+            old = self._docs.pop(doc_id, None)
+            if old is not None:
+                self._unlink(doc_id, old[1])
+
+    def _unlink(self, doc_id, norm):
+        for s in _word_starts(norm):
+            i = bisect.bisect_left(self._starts, (s, doc_id))
+            if i < len(self._starts) and self._starts[i] == (s, doc_id):
+                del self._starts[i]
+        for gram in _grams(norm):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._grams[gram]
+
+    def complete(self, query, limit=10):
+        """Up to `limit` titles matching `query`, best first."""
+        q = normalize_title(query or '')
+        with self._lock:
+            if not q:
+                ranked = sorted(self._docs.values(), key=lambda d: d[2], reverse=True)
+                return [d[0] for d in ranked[:limit]]
+            tiers = {}
+            i = bisect.bisect_left(self._starts, (q,))
+            while i < len(self._starts) and self._starts[i][0].startswith(q):
+                suffix, doc_id = self._starts[i]
+                tier = 0 if len(suffix) == len(self._docs[doc_id][1]) else 1
+                if tiers.get(doc_id, 2) > tier:
+                    tiers[doc_id] = tier
+                i += 1
+            # Substring matches rank last, so only look when prefixes fall short.
+            if len(tiers) < limit:
+                if len(q) <= 3:
+                    candidates = self._grams.get(q, _EMPTY)
+                else:
+                    postings = sorted((self._grams.get(g, _EMPTY) for g in _trigrams(q)), key=len)
+                    candidates = postings[0].intersection(*postings[1:])
+                for doc_id in candidates:
+                    if doc_id not in tiers and q in self._docs[doc_id][1]:
+                        tiers[doc_id] = 2
+            ranked = sorted(tiers, key=lambda d: self._docs[d][2], reverse=True)
+            ranked.sort(key=tiers.__getitem__)
+            return [self._docs[d][0] for d in ranked[:limit]]
+
+
+class TagIndex:
+    """Ranked tag completion: prefix matches by usage, then substrings,
+    then (optionally) near misses for typos."""
+
+    def __init__(self):
+        self._counts = {}    # tag -> number of articles using it
+        self._vocab = []     # sorted (folded tag, tag)
+        self._lock = threading.Lock()
+        self.built_at = None
+
+    def rebuild(self, counts):
+        counts = {t: n for t, n in counts.items() if n > 0}
+        vocab = sorted((t.casefold(), t) for t in counts)
+        with self._lock:
+            self._counts, self._vocab = counts, vocab
+
+    def set(self, tag, count):
+        """Record the usage count of one tag; zero removes it."""
+        with self._lock:
+            known = tag in self._counts
+            if count > 0:
+                self._counts[tag] = count
+                if not known:
+                    bisect.insort(self._vocab, (tag.casefold(), tag))
+            elif known:
+                del self._counts[tag]
+                i = bisect.bisect_left(self._vocab, (tag.casefold(), tag))
+                if i < len(self._vocab) and self._vocab[i][1] == tag:
+                    del self._vocab[i]
+
+    def adjust(self, old_tags, new_tags):
+        """Move counts for one article whose tags went from old to new."""
+        old_tags, new_tags = set(old_tags or ()), set(new_tags or ())
+        for tag in old_tags - new_tags:
+            self.set(tag, self._counts.get(tag, 0) - 1)
+        for tag in new_tags - old_tags:
+            self.set(tag, self._counts.get(tag, 0) + 1)
+
+    def complete(self, query, limit=10, fuzzy=False):
+        """Up to `limit` (tag, count) pairs matching `query`, best first."""
+        q = (query or '').strip().casefold()
+        with self._lock:
+            by_use = lambda t: (self._counts[t], t)  # noqa: E731
+            if not q:
+                return [(t, self._counts[t]) for t in heapq.nlargest(limit, self._counts, key=by_use)]
+            lo = bisect.bisect_left(self._vocab, (q,))
+            hi = lo
+            while hi < len(self._vocab) and self._vocab[hi][0].startswith(q):
+                hi += 1
+            found = heapq.nlargest(limit, (t for _, t in self._vocab[lo:hi]), key=by_use)
+            if len(found) < limit:
+                rest = (t for folded, t in self._vocab if q in folded and not folded.startswith(q))
+                found += heapq.nlargest(limit - len(found), rest, key=by_use)
+            if fuzzy and len(found) < limit:
+                seen = {t.casefold() for t in found}
+                folded = {f: t for f, t in self._vocab if f not in seen}
+                close = difflib.get_close_matches(q, folded, n=limit - len(found), cutoff=0.7)
+                found += [folded[f] for f in close]
+            return [(t, self._counts[t]) for t in found]
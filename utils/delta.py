@@ -0,0 +1,61 @@
+"""
+Compact encodings for version content.
+
+A keyframe is the full text, zlib-compressed. A delta rebuilds a text from
+the previous one: a list of line ranges to copy from the base and literal
+text to insert, JSON-encoded and zlib-compressed. Payloads are base64
+strings so they can be stored in JSON, SQLite and Firestore alike.
+
+Deltas are found with the bounded Myers diff of utils.diff, since they are
+encoded while writers hold the store lock.
+"""
+import base64
+import json
+import zlib
+
+from utils.diff import diff_sequences
+
+# Edit distance past which a region is stored as inserted text rather than
+# matched further; bounds encoding at O((N + M) * MAX_DELTA_COST).
+MAX_DELTA_COST = 500
+
+
+def _pack(raw: bytes) -> str:
+    return base64.b64encode(zlib.compress(raw, 6)).decode('ascii')
+
+
+def _unpack(payload: str) -> bytes:
+    return zlib.decompress(base64.b64decode(payload))
+
+
+def encode_keyframe(text: str) -> str:
+    return _pack(text.encode('utf-8'))
+
+
+def decode_keyframe(payload: str) -> str:
+    return _unpack(payload).decode('utf-8')
+
+
+def encode_delta(base: str, target: str) -> str:
+    """Encode `target` as edits against `base`."""
+    a = base.splitlines(keepends=True)
+    b = target.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in diff_sequences(a, b, MAX_DELTA_COST):
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(b[j1:j2]))
+    return _pack(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+
+def apply_delta(base: str, payload: str) -> str:
+    """Rebuild the text a delta was encoded for from its `base`."""
+    a = base.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(_unpack(payload)):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(a[op[0]:op[1]])
+    return ''.join(parts)
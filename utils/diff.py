@@ -1,43 +1,195 @@
 """
 Utility for comparing versions and generating diffs.
+
+Lines are compared with Myers' O(ND) algorithm in its linear-space form
+(recursing on the middle snake). Before that, common prefixes and suffixes
+are stripped and lines that occur on only one side are set aside, since they
+can never match; that keeps rewrites of whole sections cheap. Changed line
+pairs can additionally be diffed word by word.
 """
-import difflib
+import re
 from html import escape
 
+# Above this many lines per side, only the common head and tail are matched.
+MAX_DIFF_LINES = 20000
+# Give up refining a region once its edit distance exceeds this, and report
+# it as replaced. Bounds the worst case at O((N + M) * MAX_DIFF_COST).
+MAX_DIFF_COST = 1000
+# Word-level highlighting is skipped for lines longer than this.
+MAX_INTRALINE_CHARS = 2000
 
-def generate_diff(old_text, new_text):
-    """
-    Generate a side-by-side diff between two text blocks.
-    Returns a list of diff lines with indicators.
-    """
-    old_lines = old_text.split('\n')
-    new_lines = new_text.split('\n')
-    
-    differ = difflib.Differ()
-    diff_lines = list(differ.compare(old_lines, new_lines))
-    
-    return diff_lines
+_WORD_RE = re.compile(r'\w+|\s+|[^\w\s]')
+
+
+def _bisect(a, a0, a1, b, b0, b1, max_cost):
+    """Find the middle snake of a[a0:a1] vs b[b0:b1]; return its split point
+    (x, y) in absolute indices, or None if there is none within max_cost."""
+    n, m = a1 - a0, b1 - b0
+    max_d = min((n + m + 1) // 2, max_cost)
+    offset = max_d + 1
+    length = 2 * offset + 1
+    v1 = [-1] * length
+    v2 = [-1] * length
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d + 1):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a0 + x1] == b[b0 + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < length and v2[k2_offset] != -1 and x1 >= n - v2[k2_offset]:
+                    return a0 + x1, b0 + y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[a1 - x2 - 1] == b[b1 - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = x1 - (k1_offset - offset)
+                    if x1 >= n - x2:
+                        return a0 + x1, b0 + y1
+    return None
+
+
+def _matches(a, b, max_cost=MAX_DIFF_COST):
+    """Yield (i, j) for every element of a longest common subsequence found."""
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            yield a0, b0
+            a0 += 1
+            b0 += 1
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+            yield a1, b1
+        if a0 == a1 or b0 == b1:
+            continue
+        split = _bisect(a, a0, a1, b, b0, b1, max_cost)
+        if split is not None:
+            x, y = split
+            stack.append((x, a1, y, b1))
+            stack.append((a0, x, b0, y))
+
+
+def diff_sequences(a, b, max_cost=MAX_DIFF_COST):
+    """Opcodes turning `a` into `b`, in the format of
+    difflib.SequenceMatcher.get_opcodes()."""
+    # Elements present on one side only can never match: diff the rest.
+    in_a, in_b = set(a), set(b)
+    ia = [i for i, x in enumerate(a) if x in in_b]
+    ib = [j for j, x in enumerate(b) if x in in_a]
+    pairs = sorted((ia[i], ib[j]) for i, j in _matches([a[i] for i in ia], [b[j] for j in ib], max_cost))
+    opcodes = []
+    i = j = 0
+    for mi, mj in pairs + [(len(a), len(b))]:
+        if i < mi and j < mj:
+            opcodes.append(('replace', i, mi, j, mj))
+        elif i < mi:
+            opcodes.append(('delete', i, mi, j, j))
+        elif j < mj:
+            opcodes.append(('insert', i, i, j, mj))
+        if mi < len(a):
+            if opcodes and opcodes[-1][0] == 'equal':
+                opcodes[-1] = ('equal', opcodes[-1][1], mi + 1, opcodes[-1][3], mj + 1)
+            else:
+                opcodes.append(('equal', mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return opcodes
 
 
-def generate_html_diff(old_text, new_text):
+def diff_lines(old_lines, new_lines):
+    """Opcodes for two lists of lines, matching only head and tail past the size cap."""
+    if len(old_lines) <= MAX_DIFF_LINES and len(new_lines) <= MAX_DIFF_LINES:
+        return diff_sequences(old_lines, new_lines)
+    return diff_sequences(old_lines, new_lines, max_cost=0)
+
+
+def _intraline(old_line, new_line):
+    """HTML for a changed line pair with differing words wrapped in del/ins."""
+    a = _WORD_RE.findall(old_line)
+    b = _WORD_RE.findall(new_line)
+    old_parts, new_parts = [], []
+    for tag, i1, i2, j1, j2 in diff_sequences(a, b):
+        old_chunk = escape(''.join(a[i1:i2]))
+        new_chunk = escape(''.join(b[j1:j2]))
+        if tag == 'equal':
+            old_parts.append(old_chunk)
+            new_parts.append(new_chunk)
+            continue
+        if old_chunk:
+            old_parts.append(f'<del class="diff-word">{old_chunk}</del>')
+        if new_chunk:
+            new_parts.append(f'<ins class="diff-word">{new_chunk}</ins>')
+    return ''.join(old_parts), ''.join(new_parts)
+
+
+def generate_html_diff(old_text, new_text, intraline=True):
     """
     Generate HTML representation of diff with styling.
+
+    With `intraline`, lines changed in place also get their differing words
+    highlighted.
     """
-    diff_lines = generate_diff(old_text, new_text)
+    old_lines = old_text.split('\n')
+    new_lines = new_text.split('\n')
     html_parts = []
-    
-    for line in diff_lines:
-        if line.startswith('- '):
-            # Removed line
-            html_parts.append(f'<div class="diff-removed"><span class="diff-marker">−</span> {escape(line[2:])}</div>')
-        elif line.startswith('+ '):
-            # Added line
-            html_parts.append(f'<div class="diff-added"><span class="diff-marker">+</span> {escape(line[2:])}</div>')
-        elif line.startswith('? '):
-            # Hint line (skip for simplicity)
-            pass
-        else:
-            # Unchanged line
-            html_parts.append(f'<div class="diff-unchanged"><span class="diff-marker"></span> {escape(line[2:] if line.startswith("  ") else line)}</div>')
-    
+    if len(old_lines) > MAX_DIFF_LINES or len(new_lines) > MAX_DIFF_LINES:
+        html_parts.append(f'<div class="diff-notice">Versions longer than {MAX_DIFF_LINES} lines are only '
+                          f'compared at their common start and end.</div>')
+
+    def removed(html):
+        html_parts.append(f'<div class="diff-removed"><span class="diff-marker">−</span> {html}</div>')
+
+    def added(html):
+        html_parts.append(f'<div class="diff-added"><span class="diff-marker">+</span> {html}</div>')
+
+    for tag, i1, i2, j1, j2 in diff_lines(old_lines, new_lines):
+        if tag == 'equal':
+            for line in old_lines[i1:i2]:
+                html_parts.append(f'<div class="diff-unchanged"><span class="diff-marker"></span> {escape(line)}</div>')
+            continue
+        old_html = [escape(line) for line in old_lines[i1:i2]]
+        new_html = [escape(line) for line in new_lines[j1:j2]]
+        if intraline and tag == 'replace':
+            # Pair lines up in order; the words of each pair are compared.
+            for k in range(min(i2 - i1, j2 - j1)):
+                old_line, new_line = old_lines[i1 + k], new_lines[j1 + k]
+                if len(old_line) <= MAX_INTRALINE_CHARS and len(new_line) <= MAX_INTRALINE_CHARS:
+                    old_html[k], new_html[k] = _intraline(old_line, new_line)
+        for html in old_html:
+            removed(html)
+        for html in new_html:
+            added(html)
+
     return '\n'.join(html_parts)
@@ -0,0 +1,264 @@
+"""
+A thread pool with a cap on waiting work.
+
+CPU-heavy calls such as password hashing run here instead of inline, so at
+most `workers` of them compete with request handling at once. When more
+than `max_pending` calls are already waiting, new ones are refused rather
+than queued without bound.
+
+BoundedExecutor caps one process. Under a server with several worker
+processes, SharedBoundedExecutor holds the same cap across all of them by
+taking lock files in a directory they share.
+"""
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so no cross-process cap
+    fcntl = None
+
+
+class ExecutorBusy(Exception):
+    """Raised when a BoundedExecutor's queue is full."""
+
+
+class BoundedExecutor:
+    """Run calls on a fixed number of threads, keeping queueing metrics."""
+
+    def __init__(self, workers=2, max_pending=32, name='executor'):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.name = name
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0   # seconds calls spent queued
+        self.max_wait = 0.0
+        self._pending = 0       # submitted and not yet finished
+        self._running = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def run(self, fn, *args):
+        """Call fn(*args) on the pool and return its result once done.
+
+        Raises ExecutorBusy if `max_pending` calls are already waiting.
+        """
+        with self._lock:
+            if self._pending - self._running >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorBusy(f'{self.name}: {self._pending} calls in progress or queued')
+            self._pending += 1
+            if self._pid != os.getpid():
+                # Threads don't survive a fork: start a new pool in the child.
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+            pool = self._pool
+        queued_at = time.monotonic()
+
+        def call():
+            waited = time.monotonic() - queued_at
+            with self._lock:
+                self._running += 1
+                self.wait_total += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    self.completed += 1
+
+        try:
+            future = pool.submit(call)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'running': self._running,
+                'queued': self._pending - self._running,
+                'max_pending': self.max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'wait_seconds_total': round(self.wait_total, 6),
+                'max_wait_seconds': round(self.max_wait, 6),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool, self._pid = self._pool, None, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+class SharedBoundedExecutor:
+    """Run calls under a cap shared by every process using `lock_dir`.
+
+    Each of the `workers` run slots and `max_pending` queue places is a file
+    under `lock_dir` held with flock, so the kernel frees the places of a
+    process that dies. A call takes a queue place, blocks until it holds a
+    slot, then runs on this process's pool. Counters are kept per process in
+    a file next to them, so reading them never takes a place.
+    """
+
+    def __init__(self, lock_dir, workers=2, max_pending=32, name='executor'):
+        self.lock_dir = Path(lock_dir)
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.name = name
+        self._slots = [self.lock_dir / f'slot-{i}.lock' for i in range(workers)]
+        self._places = [self.lock_dir / f'queue-{i}.lock' for i in range(max_pending)]
+        self._stats_file = self.lock_dir / 'stats.json'
+        # Holding a slot admits a call anywhere, so this pool never queues.
+        self._pool = BoundedExecutor(workers, max_pending, name)
+
+    @staticmethod
+    def _take(paths):
+        """Lock the first free file of `paths`; its descriptor, or None."""
+        for path in paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def _wait_slot(self):
+        """Block until this call holds a run slot; its descriptor."""
+        fd = self._take(self._slots)
+        if fd is not None:
+            return fd
+        # All busy: wait on one, picked at random to spread the waiters.
+        fd = os.open(random.choice(self._slots), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    @staticmethod
+    def _read(fd):
+        counters = {'completed': 0, 'rejected': 0, 'wait_seconds_total': 0.0, 'max_wait_seconds': 0.0,
+                    'queued': {}, 'running': {}}
+        os.lseek(fd, 0, os.SEEK_SET)
+        raw = b''
+        while True:
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            raw += chunk
+        try:
+            counters.update(json.loads(raw))
+        except ValueError:
+            pass  # new, or a torn write from a killed process: start over
+        return counters
+
+    def _record(self, queued=0, running=0, completed=0, rejected=0, waited=None):
+        """Adjust the shared counters; queued and running count per process."""
+        pid = str(os.getpid())
+        fd = os.open(self._stats_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            counters = self._read(fd)
+            for key, step in (('queued', queued), ('running', running)):
+                if step:
+                    per_pid = counters[key]
+                    per_pid[pid] = per_pid.get(pid, 0) + step
+                    if per_pid[pid] <= 0:
+                        del per_pid[pid]
+            counters['completed'] += completed
+            counters['rejected'] += rejected
+            if waited is not None:
+                counters['wait_seconds_total'] += waited
+                counters['max_wait_seconds'] = max(counters['max_wait_seconds'], waited)
+            data = json.dumps(counters).encode('utf-8')
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def run(self, fn, *args):
+        """Call fn(*args) on the pool once a slot is free and return its result.
+
+        Raises ExecutorBusy if `max_pending` calls are already waiting in
+        any of the processes sharing `lock_dir`.
+        """
+        place = self._take(self._places)
+        if place is None:
+            self._record(rejected=1)
+            raise ExecutorBusy(f'{self.name}: {self.max_pending} calls already queued')
+        self._record(queued=1)
+        queued_at = time.monotonic()
+        try:
+            slot = self._wait_slot()
+        except BaseException:
+            self._record(queued=-1)
+            raise
+        finally:
+            os.close(place)
+        self._record(queued=-1, running=1, waited=time.monotonic() - queued_at)
+        try:
+            return self._pool.run(fn, *args)
+        finally:
+            os.close(slot)
+            self._record(running=-1, completed=1)
+
+    def stats(self):
+        fd = os.open(self._stats_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            counters = self._read(fd)
+        finally:
+            os.close(fd)
+        return {
+            'workers': self.workers,
+            'running': _live_total(counters['running']),
+            'queued': _live_total(counters['queued']),
+            'max_pending': self.max_pending,
+            'completed': counters['completed'],
+            'rejected': counters['rejected'],
+            'wait_seconds_total': round(counters['wait_seconds_total'], 6),
+            'max_wait_seconds': round(counters['max_wait_seconds'], 6),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+def _live_total(per_pid):
+    """Sum per-process counts, skipping processes that died mid-call."""
+    total = 0
+    for pid, count in per_pid.items():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            pass
+        total += count
+    return total
+
+
+def bounded_executor(workers=2, max_pending=32, name='executor', lock_dir=None):
+    """A SharedBoundedExecutor under `lock_dir` where flock is available,
+    else a per-process BoundedExecutor."""
+    if lock_dir is not None and fcntl is not None:
+        return SharedBoundedExecutor(lock_dir, workers, max_pending, name)
+    return BoundedExecutor(workers, max_pending, name)
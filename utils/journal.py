@@ -0,0 +1,321 @@
+"""
+Append-only record journal for the JSON file backend.
+
+Every mutation is written as a single JSON line instead of re-serializing the
+whole store, so a write costs O(size of the change). Concurrent writers share
+fsync calls (group commit), and the log is periodically folded into the JSON
+snapshot files by a background compaction.
+
+The log is also how Gunicorn workers stay coherent: mutations run under an
+exclusive lock on a sibling lock file, and each process tails the records
+other workers appended since it last looked. A cheap stat() of the log tells
+whether anything changed; a compaction by another worker replaces the file,
+which forces a reload from the snapshots.
+
+Records must be idempotent (full-record puts and deletes) so that replaying a
+log over a snapshot that already contains some of its records is harmless.
+
+Every record bumps a generation counter. A compacted log starts with a
+header carrying the generation it was folded at, so the counter keeps
+rising across compactions even when the file system reuses the inode.
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: single-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Key of the header record that opens a compacted log.
+HEADER_KEY = 'generation'
+
+
+def _fsync_dir(path):
+    """Make a rename in the directory of `path` durable."""
+    fd = os.open(Path(path).parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def replace_file(path, data):
+    """Durably and atomically replace `path` with the bytes `data`.
+
+    The new content reaches disk before the rename, and the rename before
+    this returns, so a crash leaves either the old file or the new one.
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+class Journal:
+    """A durable, append-only log of JSON records shared between processes.
+
+    `apply(record)` is called for every record not yet reflected in memory,
+    and `reload()` must reset the in-memory state from the snapshot files
+    before the log is replayed from the start.
+    """
+
+    def __init__(self, path, apply, reload, fsync=True):
+        self.path = Path(path)
+        self.apply = apply
+        self.reload = reload
+        self.fsync = fsync
+        # How much of which log file is reflected in memory, and how many
+        # records that is since the store began.
+        self.offset = 0
+        self.generation = 0
+        self._ino = None
+        self._loaded = False
+        self._fd = None
+        self._lock_fd = os.open(self.path.with_name(self.path.name + '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        # Threads of this process take the mutex; the process takes flock.
+        self._mutex = threading.RLock()
+        self._depth = 0
+        self._shared = False
+        self._tls = threading.local()
+        # Group commit state: tickets count appended batches.
+        self._sync_cond = threading.Condition()
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._compacting = False
+
+    # ── Locking and catching up ──────────────────────────────────
+
+    @contextmanager
+    def locked(self, shared=False):
+        """Hold the cross-process lock, with memory caught up to the log.
+
+        Re-entrant within a thread. Writes made under an exclusive hold are
+        waited on for durability after the lock is released, so other
+        writers can append and share the same fsync meanwhile.
+        """
+        with self._mutex:
+            outer = self._depth == 0
+            if outer:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                self._shared = shared
+            elif self._shared and not shared:
+                raise RuntimeError('cannot upgrade a shared journal lock')
+            self._depth += 1
+            try:
+                if outer:
+                    self.sync()
+                yield
+            finally:
+                self._depth -= 1
+                if outer and fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        if outer:
+            ticket = getattr(self._tls, 'ticket', 0)
+            self._tls.ticket = 0
+            if ticket:
+                self._wait(ticket)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def stale(self):
+        """Whether the log moved since memory last caught up. Lock-free."""
+        ino, size = self._stat()
+        return not self._loaded or ino != self._ino or size != self.offset
+
+    def refresh(self):
+        """Catch up with other processes if the log changed."""
+        if self.stale():
+            with self.locked(shared=True):
+                pass
+
+    def sync(self):
+        """Apply records appended by other processes. Caller holds the lock."""
+        ino, size = self._stat()
+        if self._loaded and ino == self._ino and size == self.offset:
+            return
+        if not self._loaded or ino != self._ino or size < self.offset:
+            # First load, or another process compacted the log.
+            self.reload()
+            self._loaded = True
+            self._ino = ino
+            self.offset = 0
+            self.generation = 0
+            self._close_fd()
+        if size > self.offset:
+            self._read_tail()
+
+    def _read_tail(self):
+        """Apply complete records past `offset`. A torn last line is left alone."""
+        applied = 0
+        with open(self.path, 'rb') as fh:
+            fh.seek(self.offset)
+            for line in fh:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if HEADER_KEY in record:
+                    self.generation = record[HEADER_KEY]
+                else:
+                    self.apply(record)
+                    self.generation += 1
+                    applied += 1
+                self.offset += len(line)
+        if applied:
+            logger.debug('Applied %d journal records from %s', applied, self.path)
+
+    # ── Appending ────────────────────────────────────────────────
+
+    def append(self, records):
+        """Append a batch of records already applied to memory.
+
+        Durable once the outermost lock is released, or on return when not
+        called under `locked()`.
+        """
+        if not records:
+            return
+        payload = b''.join(
+            json.dumps(r, default=str, separators=(',', ':')).encode('utf-8') + b'\n'
+            for r in records
+        )
+        with self.locked():
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._ino = os.fstat(self._fd).st_ino
+            if os.fstat(self._fd).st_size > self.offset:
+                # Memory is caught up, so anything past offset is a torn
+                # line left by a crashed writer.
+                logger.warning('Truncating torn journal tail in %s at byte %d', self.path, self.offset)
+                os.ftruncate(self._fd, self.offset)
+            os.write(self._fd, payload)
+            self.offset += len(payload)
+            self.generation += len(records)
+            self._written += 1
+            self._tls.ticket = self._written
+
+    def _wait(self, ticket):
+        """Wait until `ticket` is synced, fsyncing on behalf of other writers."""
+        if not self.fsync:
+            return
+        with self._sync_cond:
+            while self._synced < ticket:
+                if self._syncing:
+                    self._sync_cond.wait()
+                    continue
+                # Become the leader: one fsync covers every batch written so far.
+                self._syncing = True
+                target = self._written
+                fd = self._fd
+                self._sync_cond.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._sync_cond.acquire()
+                    self._syncing = False
+                    self._synced = max(self._synced, target)
+                    self._sync_cond.notify_all()
+
+    # ── Compaction ───────────────────────────────────────────────
+
+    @contextmanager
+    def _compaction_lock(self):
+        """Non-blocking cross-process lock; yields False if another compaction runs."""
+        fd = os.open(self.path.with_name(self.path.name + '.compact'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+        finally:
+            os.close(fd)
+
+    def compact(self, capture, write):
+        """Fold the log into a snapshot and drop the folded records.
+
+        `capture()` runs under the lock and must return a consistent copy of
+        the in-memory state; `write(state)` persists it without blocking
+        writers, and must have it on disk when it returns (see replace_file),
+        since the folded records are dropped next. Records appended meanwhile
+        are carried over into the new log.
+        Returns False if another process was already compacting.
+        """
+        with self._compaction_lock() as acquired:
+            if not acquired:
+                return False
+            with self.locked():
+                state = capture()
+                mark = self.offset
+                folded = self.generation
+            write(state)
+            with self.locked():
+                tail = b''
+                if self.offset > mark:
+                    with open(self.path, 'rb') as fh:
+                        fh.seek(mark)
+                        tail = fh.read(self.offset - mark)
+                self._close_fd()
+                header = json.dumps({HEADER_KEY: folded}).encode('utf-8') + b'\n'
+                replace_file(self.path, header + tail)
+                self._ino, self.offset = self._stat()
+        logger.info('Compacted journal %s (%d bytes carried over)', self.path, len(tail))
+        return True
+
+    def compact_in_background(self, capture, write):
+        """Start a compaction thread unless one is already running."""
+        with self._mutex:
+            if self._compacting:
+                return None
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact(capture, write)
+            except Exception:
+                logger.exception('Journal compaction failed for %s', self.path)
+            finally:
+                self._compacting = False
+
+        thread = threading.Thread(target=run, name='journal-compaction', daemon=True)
+        thread.start()
+        return thread
+
+    def _close_fd(self):
+        """Sync and close the append descriptor. Caller holds the lock."""
+        if self._fd is None:
+            return
+        with self._sync_cond:
+            while self._syncing:
+                self._sync_cond.wait()
+            if self.fsync:
+                os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+            self._synced = self._written
+
+    def close(self):
+        with self._mutex:
+            self._close_fd()
+            os.close(self._lock_fd)
@@ -0,0 +1,126 @@
+"""
+Link graph between articles, for "what links here", orphan and wanted pages.
+
+Links point at titles rather than ids, so edges are keyed by normalized
+title: a link to a page that does not exist yet is an ordinary edge whose
+target has no article. Orphan and wanted sets are kept up to date as
+articles change, so listing them costs time in the size of the answer.
+"""
+import threading
+
+from utils.parser import normalize_title
+
+
+class LinkGraph:
+    """Forward and backward adjacency of [[links]] between articles."""
+
+    def __init__(self):
+        self._titles = {}     # id -> title
+        self._by_title = {}   # normalized title -> ids
+        self._out = {}        # id -> {normalized target: link text}
+        self._in = {}         # normalized target -> ids linking to it
+        self._orphans = set()   # ids nothing else links to
+        self._wanted = set()    # normalized targets without an article
+        self._lock = threading.Lock()
+        self.built_at = None
+
+    def rebuild(self, items):
+        """Replace the graph with `items`, an iterable of (id, title, link texts)."""
+        with self._lock:
+            self._titles, self._by_title, self._out, self._in = {}, {}, {}, {}
+            self._orphans, self._wanted = set(), set()
+            for doc_id, title, links in items:
+                self._update(doc_id, title, links)
+
+    def update(self, doc_id, title, links):
+        """Set an article's title and the link texts found in its content."""
+        with self._lock:
+            self._update(doc_id, title, links)
+
+    def remove(self, doc_id):
+        with self._lock:
+            touched = set()
+            title = self._titles.pop(doc_id, None)
+            if title is not None:
+                touched.add(self._unindex_title(doc_id, title))
+            for target in self._out.pop(doc_id, {}):
+                self._unlink(doc_id, target)
+                touched.add(target)
+            self._orphans.discard(doc_id)
+            for target in touched:
+                self._refresh(target)
+
+    def _update(self, doc_id, title, links):
+        touched = set()
+        old_title = self._titles.get(doc_id)
+        if old_title != title or doc_id not in self._titles:
+            if doc_id in self._titles:
+                touched.add(self._unindex_title(doc_id, old_title))
+            self._titles[doc_id] = title
+            norm = normalize_title(title or '')
+            self._by_title.setdefault(norm, set()).add(doc_id)
+            touched.add(norm)
+        new_out = {normalize_title(text): text for text in links if text.strip()}
+        old_out = self._out.get(doc_id, {})
+        for target in old_out.keys() - new_out.keys():
+            self._unlink(doc_id, target)
+            touched.add(target)
+        for target in new_out.keys() - old_out.keys():
+            self._in.setdefault(target, set()).add(doc_id)
+            touched.add(target)
+        if new_out:
+            self._out[doc_id] = new_out
+        else:
+            self._out.pop(doc_id, None)
+        for target in touched:
+            self._refresh(target)
+
+    def _unindex_title(self, doc_id, title):
+        norm = normalize_title(title or '')
+        ids = self._by_title.get(norm)
+        if ids is not None:
+            ids.discard(doc_id)
+            if not ids:
+                del self._by_title[norm]
+        return norm
+
+    def _unlink(self, doc_id, target):
+        ids = self._in.get(target)
+        if ids is not None:
+            ids.discard(doc_id)
+            if not ids:
+                del self._in[target]
+
+    def _refresh(self, target):
+        """Recompute orphan and wanted status for everything titled `target`."""
+        sources = self._in.get(target, ())
+        ids = self._by_title.get(target, ())
+        for doc_id in ids:
+            # Links from a page to itself don't count.
+            if not sources or (len(sources) == 1 and doc_id in sources):
+                self._orphans.add(doc_id)
+            else:
+                self._orphans.discard(doc_id)
+        if sources and not ids:
+            self._wanted.add(target)
+        else:
+            self._wanted.discard(target)
+
+    def backlinks(self, title):
+        """(id, title) of the articles linking to `title`."""
+        with self._lock:
+            return [(i, self._titles[i]) for i in self._in.get(normalize_title(title or ''), ())]
+
+    def orphans(self):
+        """(id, title) of the articles no other article links to."""
+        with self._lock:
+            return [(i, self._titles[i]) for i in self._orphans]
+
+    def wanted(self):
+        """(link text, number of linking articles) for targets with no article."""
+        with self._lock:
+            out = []
+            for target in self._wanted:
+                sources = self._in[target]
+                out.append((self._out[next(iter(sources))][target], len(sources)))
+            return out
@@ -3,32 +3,29 @@ from urllib.parse import quote_plus
 
 LINK_RE = re.compile(r"\[\[([^\]]+)\]\]")
 
-def parse_internal_links(content: str) -> str:
-    """Replace occurrences of [[Article Title]] with links to the view route.
-
-    For simplicity, links will use the title query param: /articles/view?title=Title
-    This function does not validate existence of the target article.
-    """
-    def repl(m):
-        title = m.group(1).strip()
-        url = f"/articles/view?title={quote_plus(title)}"
-        return f'<a class="internal-link" href="{url}">{title}</a>'
 
-    return LINK_RE.sub(repl, content)
-import re
-from urllib.parse import quote_plus
+def link_targets(content: str) -> list:
+    """Titles of the [[Article Title]] links in `content`, in order of appearance."""
+    return [m.group(1).strip() for m in LINK_RE.finditer(content or '')]
 
-LINK_RE = re.compile(r"\[\[([^\]]+)\]\]")
 
-def parse_internal_links(content: str) -> str:
+def parse_internal_links(content: str, exists=None) -> str:
     """Replace occurrences of [[Article Title]] with links to the view route.
 
     For simplicity, links will use the title query param: /articles/view?title=Title
-    This function does not validate existence of the target article.
+    If `exists` is given, titles not in it are rendered as red links to
+    pages that have not been written yet.
     """
     def repl(m):
         title = m.group(1).strip()
         url = f"/articles/view?title={quote_plus(title)}"
+        if exists is not None and title not in exists:
+            return f'<a class="internal-link red-link" href="{url}" title="Page does not exist yet">{title}</a>'
         return f'<a class="internal-link" href="{url}">{title}</a>'
 
     return LINK_RE.sub(repl, content)
+
+
+def normalize_title(title: str) -> str:
+    """Fold case and collapse whitespace so equivalent link targets compare equal."""
+    return ' '.join(title.split()).casefold()